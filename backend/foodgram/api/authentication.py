@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# Пароль не нужен для проверки токена, а счетчики меняются запросами
+# update() без сигналов: эти поля загружаются из базы при обращении.
+UNCACHED_FIELDS = ('password', 'recipes_count', 'followers_count')
+
+
+def token_cache_key(key):
+    """Ключ общего кэша без самого токена."""
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def cached_fields():
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.name not in UNCACHED_FIELDS
+    ]
+
+
+class LocalTokenCache:
+    """Ограниченный по размеру LRU-кэш процесса со сроком жизни записей.
+
+    Другие процессы не узнают об удалении записи из этого кэша, поэтому
+    срок жизни ограничивает время, в течение которого они принимают
+    удаленный токен или отключенного пользователя.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if monotonic() - entry[0] >= self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = LocalTokenCache(
+    settings.TOKEN_CACHE_LOCAL_SIZE, settings.TOKEN_CACHE_LOCAL_TTL
+)
+
+
+def forget_tokens(keys):
+    for key in keys:
+        local_tokens.delete(key)
+        cache.delete(token_cache_key(key))
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэшей сразу и еще раз после фиксации транзакции,
+    чтобы параллельный запрос не вернул в кэш старые данные."""
+    keys = list(keys)
+    forget_tokens(keys)
+    transaction.on_commit(partial(forget_tokens, keys))
+
+
+def refresh_cached_fields(user):
+    """Заменяет значениями из базы поля пользователя из кэша, которые
+    запрос не менял.
+
+    Вызывается перед сохранением: кэш процесса может быть устаревшим, и
+    без этого save() вернул бы в базу старые значения, например снова
+    включил бы пользователя, отключенного в другом процессе.
+    """
+    cached = getattr(user, '_token_cache_values', None)
+    if cached is None:
+        return
+    del user._token_cache_values
+    unchanged = [
+        name for name, value in cached.items()
+        if getattr(user, name) == value
+    ]
+    fresh = type(user)._base_manager.filter(pk=user.pk).values(
+        *unchanged
+    ).first()
+    for name, value in (fresh or {}).items():
+        setattr(user, name, value)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием пользователя.
+
+    Поля пользователя ищутся сначала в памяти процесса, затем в общем
+    кэше Django и только потом запросом к базе. Записи удаляются при
+    удалении токена, изменении или удалении пользователя. Перед
+    сохранением пользователя неизмененные поля перечитываются из базы,
+    см. refresh_cached_fields.
+    """
+
+    def authenticate_credentials(self, key):
+        values = local_tokens.get(key)
+        if values is None:
+            values = cache.get(token_cache_key(key))
+            if values is None:
+                values = self.load_user(key)
+                cache.set(
+                    token_cache_key(key), values,
+                    settings.TOKEN_CACHE_TIMEOUT,
+                )
+            local_tokens.set(key, values)
+        # Поля, которых нет в записи, созданной до изменения модели,
+        # загружаются из базы при обращении, а удаленные пропускаются.
+        field_names = [name for name in cached_fields() if name in values]
+        user_model = get_user_model()
+        user = user_model.from_db(
+            user_model.objects.db, field_names,
+            [values[name] for name in field_names],
+        )
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        user._token_cache_values = {
+            name: values[name] for name in field_names
+        }
+        return user, Token(key=key, user=user)
+
+    @staticmethod
+    def load_user(key):
+        """Поля пользователя по токену: {имя атрибута: значение}."""
+        values = get_user_model().objects.filter(
+            auth_token__key=key
+        ).values(*cached_fields()).first()
+        if values is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        return values
@@ -0,0 +1,143 @@
+from functools import partial
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag, urlencode
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+RECIPES_NAMESPACE = 'recipes'
+TAGS_NAMESPACE = 'tags'
+INGREDIENTS_NAMESPACE = 'ingredients'
+
+
+def namespace_version(namespace):
+    """Текущая версия пространства ключей кэша.
+
+    Версия - случайная строка, а не счетчик: после перезапуска или
+    вытеснения ключа из кэша новая версия не совпадет ни с одной
+    выданной раньше, и старые ETag не подойдут к новым данным.
+    """
+    key = f'{namespace}:version'
+    version = cache.get(key)
+    if version is not None:
+        return version
+    version = uuid4().hex
+    if cache.add(key, version, None):
+        return version
+    return cache.get(key, version)
+
+
+def bump_version(namespace):
+    """Делает устаревшими все ключи пространства, не очищая кэш."""
+    cache.set(f'{namespace}:version', uuid4().hex, None)
+
+
+def increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def cache_stats(namespace):
+    """Количество попаданий и промахов кэша пространства."""
+    return {
+        name: cache.get(f'{namespace}:{name}', 0)
+        for name in ('hits', 'misses')
+    }
+
+
+def response_key(request, namespace):
+    """Ключ ответа по хосту, пути и отсортированным параметрам запроса."""
+    query = urlencode(sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists()
+    ), doseq=True)
+    digest = md5(
+        f'{request.get_host()}{request.path}?{query}'.encode()
+    ).hexdigest()
+    return f'{namespace}:{namespace_version(namespace)}:{digest}'
+
+
+def cached_response(request, namespace, get_response):
+    """Ответ анонимному пользователю из кэша или из get_response().
+
+    В кэше хранятся данные ответа, а не отрисованное содержимое, поэтому
+    согласование формата ответа продолжает работать.
+    """
+    if request.user.is_authenticated:
+        return get_response()
+    key = response_key(request, namespace)
+    data = cache.get(key)
+    if data is not None:
+        increment(f'{namespace}:hits')
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+    increment(f'{namespace}:misses')
+    response = get_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+class VersionedCacheMixin:
+    """HTTP-кэширование справочников по версии пространства ключей.
+
+    ETag вычисляется из версии, пути и формата ответа без обращения к
+    базе данных, поэтому If-None-Match обрабатывается до выборки. Полный
+    список в JSON дополнительно хранится в памяти процесса уже
+    отрисованным.
+    """
+
+    cache_namespace = None
+    rendered_lists = {}
+
+    def list(self, request, *args, **kwargs):
+        return self.versioned_response(
+            request, partial(super().list, request, *args, **kwargs),
+            keep_rendered=not request.query_params,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_response(
+            request, partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def versioned_response(self, request, get_response, keep_rendered=False):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return get_response()
+        version = namespace_version(self.cache_namespace)
+        etag = quote_etag(md5(
+            f'{version}:{request.get_full_path()}:'
+            f'{request.accepted_media_type}'.encode()
+        ).hexdigest())
+        rendered = self.rendered_lists.get(self.cache_namespace)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif keep_rendered and rendered and rendered[0] == etag:
+            response = HttpResponse(rendered[1], content_type=rendered[2])
+        else:
+            response = get_response()
+            if keep_rendered and response.status_code == 200:
+                response.add_post_render_callback(partial(
+                    self.keep_rendered_list, etag
+                ))
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, must_revalidate=True,
+            max_age=settings.REFERENCE_CACHE_MAX_AGE,
+        )
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def keep_rendered_list(self, etag, response):
+        self.rendered_lists[self.cache_namespace] = (
+            etag, response.content, response['Content-Type']
+        )
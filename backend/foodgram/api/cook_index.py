@@ -0,0 +1,186 @@
+from array import array
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+from time import monotonic
+
+from django.db import transaction
+from django.db.models import Count
+
+from core.limits import Limits
+from recipes.models import AmountIngredients
+
+INDEX_TTL = 600
+PREFIX_SIZE = Limits.COOK_MAX_MISSING + 1
+BUILD_CHUNK_SIZE = 10000
+
+
+def missing_count(ingredients, pantry, max_missing):
+    """Сколько ингредиентов рецепта нет в pantry или None, если больше
+    max_missing или нет ни одного."""
+    missing = 0
+    for ingredient_id in ingredients:
+        if ingredient_id not in pantry:
+            missing += 1
+            if missing > max_missing:
+                return None
+    if missing == len(ingredients):
+        return None
+    return missing
+
+
+class RecipeCoverageIndex:
+    """Инвертированный индекс ингредиент -> рецепты для поиска рецептов по
+    имеющимся ингредиентам.
+
+    Ингредиенты рецептов лежат подряд в одном массиве, каждый рецепт - от
+    редких ингредиентов к частым. В список рецептов ингредиента рецепт
+    попадает, только если ингредиент входит в PREFIX_SIZE самых редких
+    ингредиентов рецепта: рецепту, которому не хватает не больше
+    COOK_MAX_MISSING ингредиентов, обязательно достается ингредиент из
+    этого префикса. Кандидаты - объединение коротких списков, а не все
+    рецепты с солью, и каждый проверяется по своему отрезку массива.
+    Рецепты, измененные после построения, хранятся отдельно в changed.
+    """
+
+    def __init__(self, rows, frequencies):
+        """rows - пары (id рецепта, id ингредиента) по возрастанию id
+        рецепта, frequencies - {id ингредиента: число рецептов}."""
+        self.order = {
+            ingredient_id: position for position, ingredient_id in enumerate(
+                sorted(frequencies, key=lambda key: (frequencies[key], key))
+            )
+        }
+        self.recipe_ids = array('q')
+        self.offsets = array('I', [0])
+        self.ingredients = array('I')
+        self.postings = {}
+        self.changed = {}
+        for recipe_id, recipe_rows in groupby(rows, key=itemgetter(0)):
+            position = len(self.recipe_ids)
+            ingredients = self.ordered(row[1] for row in recipe_rows)
+            self.recipe_ids.append(recipe_id)
+            self.ingredients.extend(ingredients)
+            self.offsets.append(len(self.ingredients))
+            for ingredient_id in ingredients[:PREFIX_SIZE]:
+                posting = self.postings.get(ingredient_id)
+                if posting is None:
+                    posting = self.postings[ingredient_id] = array('I')
+                posting.append(position)
+
+    def ordered(self, ingredient_ids):
+        """Ингредиенты от редких к частым, новые считаются самыми редкими."""
+        return sorted(set(ingredient_ids), key=lambda ingredient_id: (
+            self.order.get(ingredient_id, -1), ingredient_id
+        ))
+
+    def update(self, recipes):
+        """recipes - {id рецепта: id ингредиентов}, пустой набор означает,
+        что рецепта больше нет."""
+        for recipe_id, ingredient_ids in recipes.items():
+            self.changed[recipe_id] = tuple(self.ordered(ingredient_ids))
+
+    def search(self, ingredient_ids, max_missing=0):
+        """id рецептов, которым не хватает не больше max_missing
+        ингредиентов: сначала с меньшим числом недостающих, затем с
+        большей долей имеющихся, затем новые."""
+        pantry = set(ingredient_ids)
+        changed = dict(self.changed)
+        candidates = set()
+        for ingredient_id in pantry:
+            candidates.update(self.postings.get(ingredient_id, ()))
+        found = []
+        for position in candidates:
+            recipe_id = self.recipe_ids[position]
+            if recipe_id in changed:
+                continue
+            ingredients = self.ingredients[
+                self.offsets[position]:self.offsets[position + 1]
+            ]
+            missing = missing_count(ingredients, pantry, max_missing)
+            if missing is not None:
+                found.append((missing, len(ingredients), recipe_id))
+        for recipe_id, ingredients in changed.items():
+            missing = missing_count(ingredients, pantry, max_missing)
+            if ingredients and missing is not None:
+                found.append((missing, len(ingredients), recipe_id))
+        found.sort(key=lambda item: (
+            item[0], item[0] / item[1], -item[2]
+        ))
+        return [recipe_id for _, _, recipe_id in found]
+
+    def size(self):
+        """Примерный объем массивов индекса в байтах."""
+        arrays = [self.recipe_ids, self.offsets, self.ingredients]
+        arrays.extend(self.postings.values())
+        return sum(len(values) * values.itemsize for values in arrays)
+
+
+class CookIndex:
+    """Ленивый потокобезопасный кэш индекса рецептов по ингредиентам.
+
+    Индекс строится при первом поиске и перестраивается не реже раза в
+    INDEX_TTL секунд, чтобы подхватить изменения из других процессов;
+    пока один поток перестраивает индекс, остальные ищут по старому.
+    Изменения рецептов в этом процессе вносятся в индекс после фиксации
+    транзакции.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.index = None
+        self.built_at = 0
+        self.pending = None
+
+    @staticmethod
+    def build():
+        frequencies = dict(AmountIngredients.objects.values_list(
+            'ingredient'
+        ).annotate(recipes=Count('recipe', distinct=True)).order_by())
+        rows = AmountIngredients.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=BUILD_CHUNK_SIZE)
+        return RecipeCoverageIndex(rows, frequencies)
+
+    def get_index(self):
+        index = self.index
+        if index is not None and monotonic() - self.built_at < self.ttl:
+            return index
+        if not self.lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self.index is None or monotonic() - self.built_at >= self.ttl:
+                self.pending = set()
+                self.index = self.build()
+                self.built_at = monotonic()
+                pending, self.pending = self.pending, None
+                if pending:
+                    self.refresh(pending)
+            return self.index
+        finally:
+            self.lock.release()
+
+    def refresh(self, recipe_ids):
+        """Перечитывает из базы ингредиенты рецептов."""
+        if self.pending is not None:
+            self.pending.update(recipe_ids)
+        index = self.index
+        if index is None:
+            return
+        recipes = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in AmountIngredients.objects.filter(
+            recipe_id__in=recipes
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id].append(ingredient_id)
+        index.update(recipes)
+
+    def schedule_refresh(self, recipe_ids):
+        transaction.on_commit(partial(self.refresh, list(recipe_ids)))
+
+    def search(self, ingredients, missing=0):
+        return self.get_index().search(ingredients, missing)
+
+
+cook_index = CookIndex()
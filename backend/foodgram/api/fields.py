@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+def resolve_ids(queryset, ids, message):
+    """Объекты по списку id одним запросом in_bulk() в порядке ids.
+
+    Если каких-то id нет, сообщение об ошибке перечисляет их все.
+    """
+    objects = queryset.in_bulk(set(ids))
+    missing = list(dict.fromkeys(pk for pk in ids if pk not in objects))
+    if missing:
+        raise serializers.ValidationError(
+            message.format(pk_values=', '.join(map(str, missing)))
+        )
+    return [objects[pk] for pk in ids]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, получаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        ids = []
+        for item in data:
+            if isinstance(item, bool):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            try:
+                ids.append(int(item))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+        return resolve_ids(
+            child.get_queryset(), ids, child.error_messages['does_not_exist']
+        )
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, который при many=True получает все объекты
+    одним запросом вместо запроса на каждый id."""
+
+    default_error_messages = {
+        'does_not_exist': 'Объекты не найдены: {pk_values}.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class RecipeImageField(Base64ImageField):
+    """Картинка в base64 с ограничением размера до декодирования.
+
+    Длина строки base64 проверяется до b64decode, а число пикселей — по
+    заголовку картинки, который Pillow читает без декодирования
+    изображения.
+    """
+
+    def to_internal_value(self, base64_data):
+        if isinstance(base64_data, str) and (
+            len(base64_data) * 3 // 4 > settings.IMAGE_MAX_UPLOAD_SIZE
+        ):
+            raise serializers.ValidationError(
+                'Размер картинки больше '
+                f'{filesizeformat(settings.IMAGE_MAX_UPLOAD_SIZE)}.'
+            )
+        file = super().to_internal_value(base64_data)
+        if file is not None:
+            width, height = file.image.size
+            if width * height > settings.IMAGE_MAX_PIXELS:
+                raise serializers.ValidationError(
+                    f'Картинка {width}x{height} больше '
+                    f'{settings.IMAGE_MAX_PIXELS} пикселей.'
+                )
+        return file
+
+
+def rendition_urls(recipe, request=None):
+    """{размер: {формат: ссылка}} копий картинки рецепта или None."""
+    renditions = recipe.renditions
+    if not renditions or renditions.get('source') != recipe.image.name:
+        return None
+    storage = recipe.image.storage
+    return {
+        rendition: {
+            extension: (
+                request.build_absolute_uri(storage.url(name))
+                if request else storage.url(name)
+            )
+            for extension, name in files.items()
+        }
+        for rendition, files in renditions.items()
+        if rendition != 'source'
+    }
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта.
+
+    {размер: {формат: ссылка}} или None, пока копии не построены.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return rendition_urls(recipe, self.context.get('request'))
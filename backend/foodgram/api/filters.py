@@ -1,33 +1,66 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.ingredient_search import ingredient_search
+from recipes.models import Recipe
 
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
+    'cooking_time': ('cooking_time', '-pub_date', '-id'),
+}
 
-class IngredientFilter(SearchFilter):
-    """Фильтр для ингредиентов."""
+
+class IngredientFilter(BaseFilterBackend):
+    """Фильтр для ингредиентов по индексу в памяти процесса.
+
+    Возвращает список, а не queryset, поэтому применяется только к
+    списку: get_object() ищет ингредиент в queryset.
+    """
     search_param = 'name'
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if getattr(view, 'action', None) != 'list' or not query.strip():
+            return queryset
+        return ingredient_search.search(query)
 
 
 class RecipeFilter(FilterSet):
     """Кастомные фильтры для рецептов."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    search = filters.CharFilter(method='filter_search')
+    tags = filters.CharFilter(method='filter_tags')
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
+        fields = (
+            'search', 'tags', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'ordering',
+        )
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по релевантности; явная ?ordering= ее заменяет."""
+        if not value.strip():
+            return queryset
+        return queryset.search(value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__slug__in=self.request.query_params.getlist(name),
+        )))
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -38,3 +71,6 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_list__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
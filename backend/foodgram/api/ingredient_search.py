@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+from time import monotonic
+
+from core.limits import Limits
+from recipes.models import Ingredient
+
+INDEX_TTL = 300
+MIN_FUZZY_QUERY_LENGTH = 3
+MIN_SIMILARITY = 0.3
+
+
+def normalize(value):
+    return value.lower().replace('ё', 'е').strip()
+
+
+def trigrams(value):
+    padded = f'  {value} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса.
+
+    Названия хранятся в отсортированном списке, поэтому совпадения по
+    началу находятся бинарным поиском, а для вхождений и опечаток
+    используется триграммный индекс.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda ingredient: normalize(ingredient['name'])
+        )
+        self.keys = [
+            normalize(ingredient['name']) for ingredient in self.ingredients
+        ]
+        self.trigram_counts = [len(trigrams(key)) for key in self.keys]
+        self.postings = defaultdict(list)
+        for position, key in enumerate(self.keys):
+            for trigram in trigrams(key):
+                self.postings[trigram].append(position)
+
+    def prefix_positions(self, query):
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + '\uffff', lo=start)
+        return range(start, end)
+
+    def similar_positions(self, query):
+        """Позиции по убыванию сходства триграмм с запросом."""
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+        similarity = {
+            position: count / (
+                len(query_trigrams) + self.trigram_counts[position] - count
+            )
+            for position, count in shared.items()
+        }
+        return sorted(
+            similarity, key=lambda position: (-similarity[position], position)
+        ), similarity
+
+    def search(self, query, limit):
+        """Ингредиенты: сначала по началу названия, затем по вхождению
+        всех слов запроса, затем похожие по написанию."""
+        query = normalize(query)
+        found = list(self.prefix_positions(query)[:limit])
+        if len(found) == limit:
+            return [self.ingredients[position] for position in found]
+        terms = query.split()
+        similar, similarity = [], {}
+        if len(query) >= MIN_FUZZY_QUERY_LENGTH:
+            similar, similarity = self.similar_positions(query)
+        scope = similar if len(terms) == 1 else range(len(self.keys))
+        seen = set(found)
+        contains = sorted(
+            position for position in scope
+            if position not in seen
+            and all(term in self.keys[position] for term in terms)
+        )
+        found.extend(contains[:limit - len(found)])
+        seen.update(contains)
+        found.extend([
+            position for position in similar
+            if position not in seen and similarity[position] >= MIN_SIMILARITY
+        ][:limit - len(found)])
+        return [self.ingredients[position] for position in found]
+
+
+class IngredientSearch:
+    """Ленивый потокобезопасный кэш индекса ингредиентов.
+
+    Индекс строится при первом поиске, сбрасывается сигналами при
+    изменении ингредиентов в этом процессе и перестраивается не реже раза
+    в INDEX_TTL секунд, чтобы подхватить изменения из других процессов.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.index = None
+        self.built_at = 0
+
+    def invalidate(self):
+        self.index = None
+
+    def get_index(self):
+        index = self.index
+        if index is not None and monotonic() - self.built_at < self.ttl:
+            return index
+        with self.lock:
+            if self.index is None or monotonic() - self.built_at >= self.ttl:
+                self.index = IngredientIndex(Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit'
+                ))
+                self.built_at = monotonic()
+            return self.index
+
+    def search(self, query, limit=Limits.INGREDIENT_SEARCH_RESULTS.value):
+        return self.get_index().search(query, limit)
+
+
+ingredient_search = IngredientSearch()
@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+REQUEST_HEADER = 'HTTP_X_REQUEST_METRICS'
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+_metrics = ContextVar('request_metrics', default=None)
+
+
+def sql_pattern(sql):
+    """SQL без различий в длине списков IN (...)."""
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    """Показатели одного запроса: SQL-запросы, их время и участки кода."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.patterns = Counter()
+        self.timings = defaultdict(float)
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.patterns[sql_pattern(sql)] += 1
+
+    def duplicates(self):
+        """Запросы, повторенные не меньше порога: признак N+1."""
+        threshold = settings.REQUEST_METRICS_DUPLICATE_THRESHOLD
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.patterns.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self, total):
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="queries: {self.queries}"',
+        ]
+        metrics.extend(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in self.timings.items()
+        )
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к участку name текущего запроса.
+
+    Вложенные блоки с тем же именем не учитываются повторно. Без
+    инструментирования блок выполняется как есть.
+    """
+    metrics = _metrics.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+        metrics.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Учитывает построение представления как участок serializer."""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class InstrumentationMiddleware:
+    """Считает SQL-запросы, их время, время сериализации и всего запроса.
+
+    Включается для всех запросов настройкой REQUEST_METRICS_LOG или для
+    отдельного запроса сотрудника заголовком X-Request-Metrics. Итог
+    пишется одной JSON-строкой в лог api.instrumentation, а сотруднику
+    также возвращается в заголовке Server-Timing. Повторяющиеся запросы
+    отмечаются в логе как возможная проблема N+1.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = REQUEST_HEADER in request.META
+        if not (requested or settings.REQUEST_METRICS_LOG):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        total = time.perf_counter() - metrics.started
+        user = getattr(request, 'user', None)
+        staff = requested and user is not None and user.is_staff
+        if staff:
+            response['Server-Timing'] = metrics.server_timing(total)
+        if staff or settings.REQUEST_METRICS_LOG:
+            self.log(request, response, metrics, total)
+        return response
+
+    @staticmethod
+    def log(request, response, metrics, total):
+        match = request.resolver_match
+        duplicates = metrics.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'queries': metrics.queries,
+            **{
+                f'{name}_ms': round(duration * 1000, 1)
+                for name, duration in metrics.timings.items()
+            },
+            'duplicates': duplicates,
+        }
+        logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            json.dumps(record, ensure_ascii=False),
+        )
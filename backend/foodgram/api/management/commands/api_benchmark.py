@@ -0,0 +1,232 @@
+import json
+import math
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.instrumentation import RequestMetrics
+from recipes.models import (Favourite, Ingredient, Recipe, ShopingCart,
+                            ShoppingListTotal, Tag)
+from users.models import Subscription, User
+
+TOLERANCE = 0.5
+SUBSCRIPTIONS = 10
+FAVORITES = 20
+CARTS = 10
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(share * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет запросы к адресам api/urls.py через тестовый клиент '
+        'Django и выводит p50/p95 времени ответа, число SQL-запросов и '
+        'пропускную способность по каждому адресу. Результаты можно '
+        'сохранить как базовые и сравнивать с ними следующие прогоны. '
+        'Изменения данных откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument(
+            '--baseline', type=Path, default=settings.API_BENCHMARK_BASELINE,
+            help='Файл базовых результатов, по умолчанию '
+                 'API_BENCHMARK_BASELINE.',
+        )
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Сохранить результаты как базовые.',
+        )
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Сравнить с базовыми результатами и завершиться ошибкой '
+                 'при регрессии.',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=TOLERANCE,
+            help='Допустимый относительный рост p50.',
+        )
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError(
+                'Нет рецептов: сначала выполните generate_fake_data.'
+            )
+        with transaction.atomic():
+            client = APIClient()
+            client.force_authenticate(self.create_reader())
+            results = {}
+            for name, requests in self.endpoints():
+                results[name] = self.measure(
+                    client, requests, options['requests']
+                )
+                self.report(name, results[name])
+            transaction.set_rollback(True)
+        if options['save']:
+            options['baseline'].parent.mkdir(parents=True, exist_ok=True)
+            options['baseline'].write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+            self.stdout.write(f'Базовые результаты: {options["baseline"]}')
+        if options['compare']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    @staticmethod
+    def create_reader():
+        """Пользователь с подписками, избранным и корзиной."""
+        reader = User.objects.create(
+            username='api_benchmark', email='api_benchmark@example.com',
+        )
+        authors = User.objects.exclude(pk=reader.pk).order_by(
+            '-recipes_count'
+        )[:SUBSCRIPTIONS]
+        Subscription.objects.bulk_create(
+            Subscription(user=reader, author=author) for author in authors
+        )
+        recipes = list(Recipe.objects.order_by('-pub_date', '-id')[
+            :FAVORITES
+        ])
+        Favourite.objects.bulk_create(
+            Favourite(user=reader, recipe=recipe) for recipe in recipes
+        )
+        for recipe in recipes[:CARTS]:
+            ShopingCart.objects.create(user=reader, recipe=recipe)
+            ShoppingListTotal.objects.add_recipe([reader.id], recipe)
+        return reader
+
+    @staticmethod
+    def endpoints():
+        """Имя замера и запросы одного прохода: (метод, адрес)."""
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        spare = Recipe.objects.exclude(
+            favorites__user__username='api_benchmark'
+        ).exclude(shopping_list__user__username='api_benchmark').first()
+        author = recipe.author
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        recipes = reverse('api:recipes-list')
+        users = reverse('api:users-list')
+        ingredients = reverse('api:ingredients-list')
+        endpoints = [
+            ('recipes-list', [('get', recipes)]),
+            ('recipes-list tags', [('get', f'{recipes}?tags={tag.slug}')]),
+            ('recipes-list favorited', [
+                ('get', f'{recipes}?is_favorited=1')
+            ]),
+            ('recipes-list popular', [
+                ('get', f'{recipes}?ordering=popular')
+            ]),
+            ('recipes-detail', [
+                ('get', reverse('api:recipes-detail', args=[recipe.pk]))
+            ]),
+            ('recipes-download-shopping-cart', [
+                ('get', reverse('api:recipes-download-shopping-cart'))
+            ]),
+            ('tags-list', [('get', reverse('api:tags-list'))]),
+            ('tags-detail', [
+                ('get', reverse('api:tags-detail', args=[tag.pk]))
+            ]),
+            ('ingredients-list search', [
+                ('get', f'{ingredients}?name={ingredient.name[:3]}')
+            ]),
+            ('ingredients-detail', [(
+                'get', reverse('api:ingredients-detail', args=[ingredient.pk])
+            )]),
+            ('users-list', [('get', users)]),
+            ('users-detail', [
+                ('get', reverse('api:users-detail', args=[author.pk]))
+            ]),
+            ('users-me', [('get', reverse('api:users-me'))]),
+            ('users-subscriptions', [
+                ('get', f'{reverse("api:users-subscriptions")}'
+                        '?recipes_limit=3')
+            ]),
+        ]
+        if spare is not None:
+            for name in ('favorite', 'shopping-cart'):
+                url = reverse(f'api:recipes-{name}', args=[spare.pk])
+                endpoints.append((
+                    f'recipes-{name} POST+DELETE',
+                    [('post', url), ('delete', url)],
+                ))
+        subscribe = reverse('api:users-subscribe', args=[
+            User.objects.exclude(following__user__username='api_benchmark')
+            .exclude(username='api_benchmark').first().pk
+        ])
+        endpoints.append((
+            'users-subscribe POST+DELETE',
+            [('post', subscribe), ('delete', subscribe)],
+        ))
+        return endpoints
+
+    @staticmethod
+    def run(client, requests):
+        for method, url in requests:
+            response = getattr(client, method)(url)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {url}: {response.status_code}'
+                )
+
+    def measure(self, client, requests, count):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            self.run(client, requests)
+        timings = []
+        started = time.perf_counter()
+        for _ in range(count):
+            request_started = time.perf_counter()
+            self.run(client, requests)
+            timings.append(time.perf_counter() - request_started)
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'queries': metrics.queries,
+            'rps': round(count / elapsed, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<38} p50 {result["p50_ms"]:8.2f} мс  '
+            f'p95 {result["p95_ms"]:8.2f} мс  '
+            f'запросов {result["queries"]:4}  {result["rps"]:8.1f}/с'
+        )
+
+    def compare(self, results, path, tolerance):
+        if not path.exists():
+            raise CommandError(
+                f'Нет базовых результатов: {path}. Сначала выполните '
+                'команду с --save на той же машине.'
+            )
+        baseline = json.loads(path.read_text())
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {base["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if result['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p50 {base["p50_ms"]} -> {result["p50_ms"]} мс'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базовых результатов:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базовых результатов нет.'
+        ))
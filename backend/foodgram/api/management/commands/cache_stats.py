@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import RECIPES_NAMESPACE, cache_stats, namespace_version
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает попадания и промахи кэша ответов API. Счетчики '
+        'хранятся в кэше, поэтому нужен общий для процессов кэш, '
+        'например Redis (REDIS_URL).'
+    )
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_BACKENDS:
+            raise CommandError(
+                'Кэш по умолчанию хранится в памяти процесса: счетчики '
+                'сервера этой команде не видны. Задайте REDIS_URL.'
+            )
+        for namespace in (RECIPES_NAMESPACE,):
+            stats = cache_stats(namespace)
+            requests = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / requests if requests else 0
+            self.stdout.write(
+                f'{namespace}: версия {namespace_version(namespace)}, '
+                f'попаданий {stats["hits"]}, промахов {stats["misses"]} '
+                f'({ratio:.0%})'
+            )
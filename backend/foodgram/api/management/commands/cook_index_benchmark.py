@@ -0,0 +1,170 @@
+import math
+import random
+import time
+from collections import Counter
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+
+from api.cook_index import CookIndex, RecipeCoverageIndex
+from recipes.models import AmountIngredients
+
+MISSING = (0, 1, 3)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(share * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит индекс рецептов по ингредиентам на синтетических данных '
+        'с частотой ингредиентов по закону Ципфа и выводит время '
+        'построения, объем индекса и p50/p95 поиска. С --sql сравнивает '
+        'результаты и время индекса с запросом GROUP BY по рецептам '
+        'базы данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--pantry', type=int, nargs=2, default=(10, 30),
+            metavar=('MIN', 'MAX'),
+            help='Сколько ингредиентов есть у пользователя.',
+        )
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Количество поисковых запросов на каждое число '
+                 'недостающих ингредиентов.',
+        )
+        parser.add_argument(
+            '--sql', action='store_true',
+            help='Сравнить с запросом к базе на рецептах из базы.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        if options['sql']:
+            self.compare_with_sql(options)
+            return
+        ingredient_ids = range(1, options['ingredients'] + 1)
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(ingredient_ids) + 1)
+        ))
+        started = time.perf_counter()
+        rows = self.generate_rows(
+            options['recipes'], ingredient_ids, weights,
+            options['ingredients_per_recipe'],
+        )
+        frequencies = Counter(ingredient_id for _, ingredient_id in rows)
+        self.stdout.write(
+            f'Данные: {options["recipes"]} рецептов, {len(rows)} строк '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+        started = time.perf_counter()
+        index = RecipeCoverageIndex(rows, frequencies)
+        self.stdout.write(
+            f'Построение индекса: {time.perf_counter() - started:.1f} с, '
+            f'{index.size() / 2 ** 20:.1f} МиБ'
+        )
+        del rows
+        pantries = [
+            self.pantry(ingredient_ids, weights, options['pantry'])
+            for _ in range(options['queries'])
+        ]
+        for missing in MISSING:
+            self.report(f'индекс, не хватает {missing}', self.measure(
+                lambda pantry: index.search(pantry, missing), pantries
+            ))
+
+    def generate_rows(self, count, ingredient_ids, weights, size_range):
+        rows = []
+        for recipe_id in range(1, count + 1):
+            ingredients = set(self.rng.choices(
+                ingredient_ids, cum_weights=weights,
+                k=self.rng.randint(*size_range),
+            ))
+            rows.extend((recipe_id, ingredient) for ingredient in ingredients)
+        return rows
+
+    def pantry(self, ingredient_ids, weights, size_range):
+        return list(set(self.rng.choices(
+            ingredient_ids, cum_weights=weights,
+            k=self.rng.randint(*size_range),
+        )))
+
+    @staticmethod
+    def measure(search, pantries):
+        timings = []
+        found = 0
+        for pantry in pantries:
+            started = time.perf_counter()
+            found += len(search(pantry))
+            timings.append(time.perf_counter() - started)
+        return timings, found / len(pantries)
+
+    def report(self, title, result):
+        timings, found = result
+        self.stdout.write(
+            f'{title:<30} p50 {percentile(timings, 0.5) * 1000:8.2f} мс  '
+            f'p95 {percentile(timings, 0.95) * 1000:8.2f} мс  '
+            f'найдено в среднем {found:.1f}'
+        )
+
+    @staticmethod
+    def sql_search(pantry, missing):
+        return list(AmountIngredients.objects.values('recipe').annotate(
+            total=Count('ingredient', distinct=True),
+            matched=Count(
+                'ingredient', distinct=True, filter=Q(ingredient__in=pantry)
+            ),
+        ).filter(
+            matched__gte=1, total__lte=F('matched') + missing
+        ).values_list('recipe', flat=True).order_by())
+
+    def compare_with_sql(self, options):
+        frequencies = Counter(dict(AmountIngredients.objects.values_list(
+            'ingredient'
+        ).annotate(recipes=Count('recipe')).order_by()))
+        if not frequencies:
+            raise CommandError(
+                'Нет рецептов: сначала выполните generate_fake_data.'
+            )
+        started = time.perf_counter()
+        index = CookIndex.build()
+        self.stdout.write(
+            f'Построение индекса по базе: '
+            f'{time.perf_counter() - started:.1f} с, '
+            f'{index.size() / 2 ** 20:.1f} МиБ'
+        )
+        ingredient_ids, counts = zip(*frequencies.most_common())
+        weights = list(accumulate(counts))
+        pantries = [
+            self.pantry(ingredient_ids, weights, options['pantry'])
+            for _ in range(options['queries'])
+        ]
+        for missing in MISSING:
+            mismatches = sum(
+                set(index.search(pantry, missing))
+                != set(self.sql_search(pantry, missing))
+                for pantry in pantries
+            )
+            if mismatches:
+                raise CommandError(
+                    f'Не хватает {missing}: результаты индекса и SQL '
+                    f'расходятся в {mismatches} запросах.'
+                )
+            self.report(f'индекс, не хватает {missing}', self.measure(
+                lambda pantry: index.search(pantry, missing), pantries
+            ))
+            self.report(f'SQL, не хватает {missing}', self.measure(
+                lambda pantry: self.sql_search(pantry, missing), pantries
+            ))
@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredient_search import ingredient_search
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск ингредиентов по индексу в памяти '
+        'с запросом name ILIKE через ORM.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries', type=int, default=500,
+            help='Количество поисковых запросов.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Нет ингредиентов, сначала загрузите данные.')
+        generator = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['queries']):
+            name = generator.choice(names)
+            query = name[:generator.randint(1, min(len(name), 6))]
+            if len(query) > 3 and generator.random() < 0.3:
+                position = generator.randrange(len(query))
+                query = query[:position] + query[position + 1:]
+            queries.append(query)
+        ingredient_search.get_index()
+        for title, search in (
+            ('ORM icontains', lambda query: list(
+                Ingredient.objects.filter(name__icontains=query).values(
+                    'id', 'name', 'measurement_unit'
+                )
+            )),
+            ('индекс', ingredient_search.search),
+        ):
+            started = time.perf_counter()
+            for query in queries:
+                search(query)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{title:>15}: {elapsed / len(queries) * 1e6:10.1f} мкс '
+                'на запрос'
+            )
@@ -0,0 +1,99 @@
+import logging
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from rest_framework.test import APIClient
+
+from api.instrumentation import InstrumentationMiddleware
+from users.models import User
+
+MIDDLEWARE_PATH = 'api.instrumentation.InstrumentationMiddleware'
+URLS = ('/api/tags/', '/api/recipes/', '/api/users/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет накладные расходы InstrumentationMiddleware: отдельно '
+        'на пустом обработчике и на запросах к API без промежуточного '
+        'слоя, с выключенным и с включенным заголовком инструментированием.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('api.instrumentation')
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            self.measure_middleware(options['calls'])
+            with transaction.atomic():
+                self.measure_requests(options['requests'])
+                transaction.set_rollback(True)
+        finally:
+            logger.setLevel(level)
+
+    def measure_middleware(self, calls):
+        response = HttpResponse()
+
+        def get_response(request):
+            return response
+
+        factory = RequestFactory()
+        plain = factory.get('/api/tags/')
+        requested = factory.get('/api/tags/', HTTP_X_REQUEST_METRICS='1')
+        middleware = InstrumentationMiddleware(get_response)
+        cases = (
+            ('без слоя', get_response, plain),
+            ('выключено', middleware, plain),
+            ('включено', middleware, requested),
+        )
+        for title, handler, request in cases:
+            started = time.perf_counter()
+            for _ in range(calls):
+                handler(request)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'пустой обработчик, {title:<10}: '
+                f'{elapsed / calls * 1e6:8.2f} мкс на вызов'
+            )
+
+    def measure_requests(self, count):
+        staff = User.objects.create(
+            username='instrumentation_benchmark',
+            email='instrumentation_benchmark@example.com',
+            is_staff=True,
+        )
+        without = [
+            path for path in settings.MIDDLEWARE if path != MIDDLEWARE_PATH
+        ]
+        for url in URLS:
+            with override_settings(MIDDLEWARE=without):
+                bare = self.median(staff, url, count, {})
+            disabled = self.median(staff, url, count, {})
+            enabled = self.median(
+                staff, url, count, {'HTTP_X_REQUEST_METRICS': '1'}
+            )
+            self.stdout.write(
+                f'{url:<16} без слоя {bare:7.2f} мс, выключено '
+                f'{disabled:7.2f} мс ({disabled - bare:+.3f}), включено '
+                f'{enabled:7.2f} мс ({enabled - bare:+.3f})'
+            )
+
+    @staticmethod
+    def median(user, url, count, headers):
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get(url, **headers)
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            client.get(url, **headers)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000
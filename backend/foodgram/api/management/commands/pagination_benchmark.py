@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.pagination import CustomPagination, RecipeKeysetPagination
+from recipes.images import benchmark_image
+from recipes.models import Recipe
+from users.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время выборки страницы рецептов через OFFSET и по '
+        'курсору на разной глубине. Недостающие рецепты создаются во '
+        'временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--offsets', nargs='+', type=int, default=[0, 100000],
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        offsets = options['offsets']
+        page_size = CustomPagination.page_size
+        with transaction.atomic():
+            self.ensure_recipes(max(offsets) + page_size)
+            ordering = RecipeKeysetPagination.ordering
+            recipes = Recipe.objects.order_by(*ordering)
+            for offset in offsets:
+                anchor = recipes[offset - 1] if offset else None
+                by_offset = self.measure(options['repeat'], lambda: (
+                    recipes.count(),
+                    list(recipes[offset:offset + page_size]),
+                ))
+                paginator = RecipeKeysetPagination()
+                condition = paginator.after(
+                    [getattr(anchor, field.lstrip('-')) for field in ordering]
+                ) if anchor else None
+                by_cursor = self.measure(options['repeat'], lambda: list(
+                    (recipes.filter(condition) if condition else recipes)[
+                        :page_size + 1
+                    ]
+                ))
+                self.stdout.write(
+                    f'смещение {offset:>8}: OFFSET {by_offset:8.2f} мс, '
+                    f'курсор {by_cursor:8.2f} мс'
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(repeat, query):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def ensure_recipes(self, count):
+        missing = count - Recipe.objects.count()
+        if missing <= 0:
+            return
+        author, _ = User.objects.get_or_create(
+            username='pagination_benchmark',
+            defaults={'email': 'pagination_benchmark@example.com'},
+        )
+        self.stdout.write(f'Создаются временные рецепты: {missing}')
+        image, renditions = benchmark_image()
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author, name=f'Рецепт {number}', text='Текст',
+                    image=image, renditions=renditions, cooking_time=1,
+                )
+                for number in range(missing)
+            ),
+            batch_size=BATCH_SIZE,
+        )
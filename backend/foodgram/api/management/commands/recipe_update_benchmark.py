@@ -0,0 +1,158 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.serializers import CreateRecipeSerializer
+from recipes.images import benchmark_image
+from recipes.models import AmountIngredients, Ingredient, Recipe, Tag
+from users.models import User
+
+
+def legacy_update(recipe, validated_data):
+    """Прежнее обновление: теги и ингредиенты удаляются и создаются
+    заново."""
+    recipe.tags.clear()
+    AmountIngredients.objects.filter(recipe=recipe).delete()
+    recipe.tags.set(validated_data['tags'])
+    AmountIngredients.objects.bulk_create(
+        AmountIngredients(
+            recipe=recipe, ingredient=item['id'], amount=item['amount']
+        )
+        for item in validated_data['ingredients']
+    )
+    recipe.name = validated_data['name']
+    recipe.save()
+
+
+def diff_update(recipe, validated_data):
+    CreateRecipeSerializer().update(recipe, dict(validated_data))
+
+
+def snapshot(recipe):
+    return (
+        dict(AmountIngredients.objects.filter(
+            recipe=recipe
+        ).values_list('id', 'amount')),
+        set(Recipe.tags.through.objects.filter(
+            recipe=recipe
+        ).values_list('id', flat=True)),
+    )
+
+
+def churn(before, after):
+    """Вставленные, измененные и удаленные строки ингредиентов и тегов."""
+    (old_rows, old_tags), (new_rows, new_tags) = before, after
+    return (
+        len(new_rows.keys() - old_rows.keys()) + len(new_tags - old_tags),
+        sum(
+            old_rows[row_id] != new_rows[row_id]
+            for row_id in old_rows.keys() & new_rows.keys()
+        ),
+        len(old_rows.keys() - new_rows.keys()) + len(old_tags - new_tags),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает прежнее обновление рецепта (удаление и пересоздание '
+        'тегов и ингредиентов) с обновлением по разнице: число '
+        'вставленных, измененных и удаленных строк, запросов и время. '
+        'Данные создаются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipe, tags, ingredients = self.create_recipe(
+                options['ingredients']
+            )
+            base = {
+                'name': recipe.name,
+                'tags': tags[:2],
+                'ingredients': [
+                    {'id': ingredient, 'amount': 10}
+                    for ingredient in ingredients[:-1]
+                ],
+            }
+            scenarios = {
+                'только название': {**base, 'name': 'Новое название'},
+                'одно количество': {**base, 'ingredients': [
+                    {'id': ingredients[0], 'amount': 20},
+                    *base['ingredients'][1:],
+                ]},
+                'замена ингредиента и тега': {
+                    **base,
+                    'tags': tags[1:],
+                    'ingredients': [
+                        *base['ingredients'][1:],
+                        {'id': ingredients[-1], 'amount': 10},
+                    ],
+                },
+            }
+            for title, validated_data in scenarios.items():
+                self.stdout.write(title)
+                for strategy, update in (
+                    ('пересоздание', legacy_update),
+                    ('по разнице', diff_update),
+                ):
+                    self.stdout.write('  ' + self.measure(
+                        strategy, update, recipe, validated_data
+                    ))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(strategy, update, recipe, validated_data):
+        with transaction.atomic():
+            recipe = Recipe.objects.get(pk=recipe.pk)
+            before = snapshot(recipe)
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                update(recipe, validated_data)
+            elapsed = (time.perf_counter() - started) * 1000
+            inserted, updated, deleted = churn(before, snapshot(recipe))
+            transaction.set_rollback(True)
+        return (
+            f'{strategy:<14} вставлено {inserted:>3}, изменено '
+            f'{updated:>3}, удалено {deleted:>3}, запросов '
+            f'{len(queries):>3}, {elapsed:7.2f} мс'
+        )
+
+    @staticmethod
+    def create_recipe(count):
+        author = User.objects.create(
+            username='recipe_update_benchmark',
+            email='recipe_update_benchmark@example.com',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number} для замера',
+                color=f'#ABCDE{number}',
+                slug=f'recipe-update-benchmark-{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'Ингредиент {number} для замера', measurement_unit='г'
+            )
+            for number in range(count + 1)
+        )
+        if not ingredients[0].pk:
+            ingredients = list(Ingredient.objects.filter(
+                name__endswith='для замера'
+            ).order_by('id'))
+        image, renditions = benchmark_image()
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт для замера', text='Текст',
+            image=image, renditions=renditions, cooking_time=1,
+        )
+        recipe.tags.set(tags[:2])
+        AmountIngredients.objects.bulk_create(
+            AmountIngredients(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in ingredients[:-1]
+        )
+        return recipe, tags, ingredients
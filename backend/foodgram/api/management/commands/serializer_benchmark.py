@@ -0,0 +1,151 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.representations import (FastIngredientSerializer,
+                                 FastRecipeReadSerializer,
+                                 FastSubscribeListSerializer,
+                                 FastTagSerializer)
+from api.serializers import (IngredientSerializer, RecipeReadSerializer,
+                             SubscribeListSerializer, TagSerializer)
+from recipes.images import benchmark_image
+from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
+                            Tag)
+from users.models import Subscription, User
+
+AUTHORS = 10
+INGREDIENTS_PER_RECIPE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет JSON быстрых сериализаторов чтения с базовыми '
+        'сериализаторами DRF и сравнивает число сериализаций в секунду. '
+        'Данные создаются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            reader = self.create_data(options['recipes'])
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = reader
+            authors = list(User.objects.filter(
+                following__user=reader
+            ).annotate(
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ).order_by('username'))
+            cases = (
+                ('рецепты', RecipeReadSerializer, FastRecipeReadSerializer,
+                 list(Recipe.objects.for_read(reader)[:options['recipes']]),
+                 {}),
+                ('теги', TagSerializer, FastTagSerializer,
+                 list(Tag.objects.all()), {}),
+                ('ингредиенты', IngredientSerializer,
+                 FastIngredientSerializer, list(Ingredient.objects.all()), {}),
+                ('поиск', IngredientSerializer, FastIngredientSerializer,
+                 list(Ingredient.objects.values(
+                     'id', 'name', 'measurement_unit'
+                 )), {}),
+                ('подписки', SubscribeListSerializer,
+                 FastSubscribeListSerializer, authors,
+                 {'recipes_by_author': Recipe.objects.latest_by_author(
+                     [author.id for author in authors], 3
+                 )}),
+            )
+            for title, slow, fast, objects, context in cases:
+                context = {'request': request, **context}
+                self.check_parity(title, slow, fast, objects, context)
+                slow_rate = self.measure(
+                    slow, objects, context, options['repeat']
+                )
+                fast_rate = self.measure(
+                    fast, objects, context, options['repeat']
+                )
+                self.stdout.write(
+                    f'{title:<12} {len(objects):>6} объектов: DRF '
+                    f'{slow_rate:10.0f}/с, быстрый {fast_rate:10.0f}/с, '
+                    f'x{fast_rate / slow_rate:.1f}'
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def render(serializer_class, objects, context):
+        return JSONRenderer().render(
+            serializer_class(objects, many=True, context=context).data
+        )
+
+    def check_parity(self, title, slow, fast, objects, context):
+        for instance in objects:
+            expected = self.render(slow, [instance], context)
+            actual = self.render(fast, [instance], context)
+            if expected != actual:
+                raise CommandError(
+                    f'{title}: представления различаются\n'
+                    f'{expected.decode()}\n{actual.decode()}'
+                )
+
+    @staticmethod
+    def measure(serializer_class, objects, context, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serializer_class(objects, many=True, context=context).data
+            timings.append(time.perf_counter() - started)
+        return len(objects) / min(timings)
+
+    @staticmethod
+    def create_data(count):
+        authors = [
+            User.objects.create(
+                username=f'serializer_benchmark_{number}',
+                email=f'serializer_benchmark_{number}@example.com',
+                first_name='Имя', last_name='Фамилия',
+            )
+            for number in range(AUTHORS + 1)
+        ]
+        reader = authors.pop()
+        Subscription.objects.bulk_create(
+            Subscription(user=reader, author=author) for author in authors
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number} для замера', color=f'#ABCDF{number}',
+                slug=f'serializer-benchmark-{number}',
+            )
+            for number in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'Ингредиент {number} для замера', measurement_unit='г'
+            )
+            for number in range(INGREDIENTS_PER_RECIPE)
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__endswith='для замера'
+        ))
+        image, renditions = benchmark_image()
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=authors[number % AUTHORS], name=f'Рецепт {number}',
+                text='Текст', image=image, cooking_time=5,
+                renditions=renditions if number % 3 else {},
+            )
+            recipe.tags.set(tags[:number % 3 + 1])
+            AmountIngredients.objects.bulk_create(
+                AmountIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1,
+                )
+                for ingredient in ingredients
+            )
+            if number % 2:
+                Favourite.objects.create(user=reader, recipe=recipe)
+        return reader
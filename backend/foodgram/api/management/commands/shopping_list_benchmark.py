@@ -0,0 +1,59 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import render_pdf
+
+CHUNK_SIZE = 8192
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время и память выгрузки списка покупок в PDF.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10, 100, 1000],
+            help='Количество ингредиентов в корзине.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество прогонов для каждого размера.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"ингредиентов":>12} {"мс":>10} {"пик, КБ":>10} '
+            f'{"RSS, КБ":>10} {"PDF, КБ":>10}'
+        )
+        for size in options['sizes']:
+            ingredients = [
+                {
+                    'ingredient__name': f'Ингредиент {number}',
+                    'ingredient__measurement_unit': 'г',
+                    'amount': number,
+                }
+                for number in range(size)
+            ]
+            timings = []
+            tracemalloc.start()
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                document_size = self.consume(render_pdf(iter(ingredients)))
+                timings.append(time.perf_counter() - started)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.stdout.write(
+                f'{size:>12} {min(timings) * 1000:>10.1f} '
+                f'{peak // 1024:>10} {rss:>10} {document_size // 1024:>10}'
+            )
+
+    @staticmethod
+    def consume(file):
+        size = 0
+        with file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+        return size
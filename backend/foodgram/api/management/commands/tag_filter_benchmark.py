@@ -0,0 +1,203 @@
+import random
+import time
+from itertools import product
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.filters import RecipeFilter
+from api.pagination import CustomPagination
+from recipes.images import benchmark_image
+from recipes.models import Favourite, Recipe, ShopingCart, Tag
+from users.models import User
+
+BATCH_SIZE = 10000
+TAGS_COUNT = 5
+MATRIX_RECIPES = 2000
+TAG_SETS = ((), (0,), (0, 1), (0, 1, 2, 3), ('missing',))
+FLAGS = (None, '1', '0')
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет RecipeFilter на всех сочетаниях тегов, is_favorited и '
+        'is_in_shopping_cart: рецепты не повторяются и совпадают с '
+        'фильтрацией через JOIN с DISTINCT. Затем сравнивает время '
+        'фильтрации по тегам RecipeFilter и через JOIN с DISTINCT. '
+        'Данные создаются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument(
+            '--matrix-recipes', type=int, default=MATRIX_RECIPES,
+            help='На скольких рецептах проверять сочетания фильтров.',
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            generator = random.Random(options['seed'])
+            tags, author = self.create_data(options['recipes'], generator)
+            reader = self.create_reader(
+                author, options['matrix_recipes'], generator
+            )
+            matrix = Recipe.objects.filter(author=author).order_by('id')[
+                :options['matrix_recipes']
+            ]
+            errors = self.check_matrix(
+                tags, reader, Recipe.objects.filter(
+                    pk__in=list(matrix.values_list('id', flat=True))
+                )
+            )
+            if errors:
+                raise CommandError('\n'.join(errors))
+            self.stdout.write(self.style.SUCCESS(
+                f'Сочетаний фильтров проверено: '
+                f'{len(TAG_SETS) * len(FLAGS) ** 2}, расхождений нет.'
+            ))
+            self.benchmark(
+                tags, reader, Recipe.objects.filter(author=author),
+                options['repeat'],
+            )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def slugs(tags, tag_set):
+        return [
+            tags[number].slug if isinstance(number, int) else number
+            for number in tag_set
+        ]
+
+    @staticmethod
+    def filtered(queryset, reader, params):
+        """Рецепты после RecipeFilter, как в RecipeViewSet."""
+        request = APIRequestFactory().get('/api/recipes/', params)
+        force_authenticate(request, reader)
+        request = Request(request)
+        request.user = reader
+        return RecipeFilter(
+            data=request.query_params, queryset=queryset, request=request,
+        ).qs
+
+    @staticmethod
+    def joined(queryset, reader, slugs, is_favorited, is_in_shopping_cart):
+        """Прежняя фильтрация через JOIN с DISTINCT."""
+        if slugs:
+            queryset = queryset.filter(tags__slug__in=slugs)
+        if is_favorited == '1':
+            queryset = queryset.filter(favorites__user=reader)
+        if is_in_shopping_cart == '1':
+            queryset = queryset.filter(shopping_list__user=reader)
+        return queryset.distinct()
+
+    def check_matrix(self, tags, reader, queryset):
+        errors = []
+        ordering = ('-pub_date', '-id')
+        for tag_set, is_favorited, is_in_shopping_cart in product(
+            TAG_SETS, FLAGS, FLAGS
+        ):
+            slugs = self.slugs(tags, tag_set)
+            params = {'tags': slugs}
+            if is_favorited is not None:
+                params['is_favorited'] = is_favorited
+            if is_in_shopping_cart is not None:
+                params['is_in_shopping_cart'] = is_in_shopping_cart
+            ids = list(self.filtered(queryset, reader, params).order_by(
+                *ordering
+            ).values_list('id', flat=True))
+            expected = list(self.joined(
+                queryset, reader, slugs, is_favorited, is_in_shopping_cart
+            ).order_by(*ordering).values_list('id', flat=True))
+            if len(ids) != len(set(ids)):
+                errors.append(f'{params}: повторяющиеся рецепты')
+            if ids != expected:
+                errors.append(
+                    f'{params}: {len(ids)} рецептов вместо {len(expected)}'
+                )
+        return errors
+
+    def benchmark(self, tags, reader, queryset, repeat):
+        page_size = CustomPagination.page_size
+        for tag_set in TAG_SETS[1:4]:
+            slugs = self.slugs(tags, tag_set)
+            for title, filtered in (
+                ('JOIN + DISTINCT', self.joined(
+                    queryset, reader, slugs, None, None
+                )),
+                ('RecipeFilter', self.filtered(
+                    queryset, reader, {'tags': slugs}
+                )),
+            ):
+                elapsed = self.measure(repeat, lambda: (
+                    filtered.count(), list(filtered[:page_size]),
+                ))
+                self.stdout.write(
+                    f'тегов {len(slugs)}, {title:>15}: {elapsed:10.1f} мс'
+                )
+
+    @staticmethod
+    def measure(repeat, query):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def create_data(self, count, generator):
+        author, _ = User.objects.get_or_create(
+            username='tag_filter_benchmark',
+            defaults={'email': 'tag_filter_benchmark@example.com'},
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег для замеров {number}',
+                color=f'#ABCDE{number}',
+                slug=f'tag-filter-benchmark-{number}',
+            )
+            for number in range(TAGS_COUNT)
+        ]
+        self.stdout.write(f'Создаются временные рецепты: {count}')
+        RecipeTag = Recipe.tags.through
+        image, renditions = benchmark_image()
+        for start in range(0, count, BATCH_SIZE):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author, name=f'Рецепт {number}', text='Текст',
+                    image=image, renditions=renditions, cooking_time=1,
+                )
+                for number in range(start, min(start + BATCH_SIZE, count))
+            )
+            if recipes[0].pk is None:
+                recipes = Recipe.objects.filter(
+                    author=author
+                ).order_by('-id')[:len(recipes)]
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe.pk, tag_id=tag.pk)
+                for recipe in recipes
+                for tag in generator.sample(tags, generator.randint(1, 3))
+            )
+        return tags, author
+
+    @staticmethod
+    def create_reader(author, count, generator):
+        """Пользователь с избранным и корзиной из проверяемых рецептов."""
+        reader = User.objects.create(
+            username='tag_filter_reader',
+            email='tag_filter_reader@example.com',
+        )
+        recipe_ids = list(Recipe.objects.filter(author=author).order_by(
+            'id'
+        ).values_list('id', flat=True)[:count])
+        for model in (Favourite, ShopingCart):
+            model.objects.bulk_create(
+                model(user=reader, recipe_id=recipe_id)
+                for recipe_id in generator.sample(
+                    recipe_ids, len(recipe_ids) // 3
+                )
+            )
+        return reader
@@ -0,0 +1,146 @@
+from collections import Counter
+from threading import Barrier, Lock, Thread
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+from recipes.images import benchmark_image
+from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
+                            ShopingCart, ShoppingListTotal, StoredFile)
+from users.models import Subscription, User
+
+PREFIX = 'toggle_stress'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка добавления и удаления избранного, корзины и '
+        'подписок из нескольких потоков одновременно: ни один запрос не '
+        'должен завершиться ошибкой 500, а счетчики и итоги списков '
+        'покупок должны сойтись. Временные данные удаляются. SQLite '
+        'выполняет записи по очереди, гонки полноценно проверяются на '
+        'PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        image, renditions = benchmark_image()
+        self.cleanup(image)
+        author = User.objects.create_user(
+            username=f'{PREFIX}_author', email=f'{PREFIX}_author@example.com'
+        )
+        follower = User.objects.create_user(
+            username=f'{PREFIX}_user', email=f'{PREFIX}_user@example.com'
+        )
+        ingredient = Ingredient.objects.create(
+            name=f'{PREFIX}_ingredient', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name=f'{PREFIX}_recipe', text='Текст',
+            image=image, renditions=renditions, cooking_time=1,
+        )
+        AmountIngredients.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=10
+        )
+        try:
+            self.run_threads(
+                follower, recipe, author,
+                options['threads'], options['rounds'],
+            )
+            errors = self.check_state(recipe, author, follower)
+        finally:
+            self.cleanup(image)
+        self.stdout.write(', '.join(
+            f'{code}: {count}'
+            for code, count in sorted(self.statuses.items())
+        ))
+        server_errors = sum(
+            count for code, count in self.statuses.items() if code >= 500
+        )
+        if server_errors:
+            errors.append(f'ответов 5xx: {server_errors}')
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS(
+            'Ошибок нет, счетчики согласованы.'
+        ))
+
+    def run_threads(self, user, recipe, author, threads, rounds):
+        """Все потоки одновременно переключают одни и те же связи одного
+        пользователя, как при многократном нажатии кнопки."""
+        urls = (
+            f'/api/recipes/{recipe.pk}/favorite/',
+            f'/api/recipes/{recipe.pk}/shopping_cart/',
+            f'/api/users/{author.pk}/subscribe/',
+        )
+        barrier = Barrier(threads)
+        self.statuses = Counter()
+        lock = Lock()
+
+        def toggle():
+            client = APIClient()
+            client.force_authenticate(user)
+            seen = Counter()
+            try:
+                barrier.wait()
+                for _ in range(rounds):
+                    for method in (client.post, client.delete):
+                        for url in urls:
+                            seen[method(url).status_code] += 1
+            finally:
+                connection.close()
+            with lock:
+                self.statuses.update(seen)
+
+        workers = [Thread(target=toggle) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    @staticmethod
+    def check_state(recipe, author, user):
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        errors = []
+        expected = {
+            'favorites_count': Favourite.objects.filter(recipe=recipe).count(),
+            'in_carts_count': ShopingCart.objects.filter(
+                recipe=recipe
+            ).count(),
+        }
+        for field, count in expected.items():
+            if getattr(recipe, field) != count:
+                errors.append(
+                    f'{field} = {getattr(recipe, field)}, строк {count}'
+                )
+        followers = Subscription.objects.filter(author=author).count()
+        if author.followers_count != followers:
+            errors.append(
+                f'followers_count = {author.followers_count}, '
+                f'строк {followers}'
+            )
+        totals = {
+            key: amount
+            for key, amount in ShoppingListTotal.objects.calculate().items()
+            if key[0] == user.pk
+        }
+        actual = dict(
+            ((user.pk, ingredient_id), amount)
+            for ingredient_id, amount in ShoppingListTotal.objects.filter(
+                user=user
+            ).values_list('ingredient_id', 'amount')
+        )
+        if totals != actual:
+            errors.append(f'итоги списка покупок {actual}, ожидалось {totals}')
+        return errors
+
+    @staticmethod
+    def cleanup(image):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Ingredient.objects.filter(name__startswith=PREFIX).delete()
+        StoredFile.objects.filter(name=image, references=0).delete()
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.authentication import CachedTokenAuthentication, local_tokens
+from api.instrumentation import RequestMetrics
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время и число SQL-запросов аутентификации по токену '
+        'DRF и с кэшированием пользователя. Изменения данных '
+        'откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(
+                username='token_benchmark',
+                email='token_benchmark@example.com',
+            )
+            key = Token.objects.create(user=user).key
+            local_tokens.clear()
+            for title, authentication in (
+                ('TokenAuthentication', TokenAuthentication()),
+                ('CachedTokenAuthentication', CachedTokenAuthentication()),
+            ):
+                metrics = RequestMetrics()
+                started = time.perf_counter()
+                with connection.execute_wrapper(metrics):
+                    for _ in range(options['requests']):
+                        authentication.authenticate_credentials(key)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{title:>26}: '
+                    f'{elapsed / options["requests"] * 1e6:8.1f} мкс, '
+                    f'запросов {metrics.queries}'
+                )
+            transaction.set_rollback(True)
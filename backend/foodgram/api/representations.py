@@ -0,0 +1,166 @@
+from api.fields import rendition_urls
+from api.serializers import (CustomUserSerializer, IngredientSerializer,
+                             RecipeReadSerializer, RecipeShortSerializer,
+                             SubscribeListSerializer, TagSerializer)
+
+
+def file_url(file, request):
+    """Ссылка на файл, как в rest_framework.fields.FileField."""
+    if not file:
+        return None
+    url = file.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def tag_representation(tag):
+    return {
+        'id': tag.id,
+        'name': tag.name,
+        'color': tag.color,
+        'slug': tag.slug,
+    }
+
+
+def ingredient_representation(ingredient):
+    """Ингредиент-модель или словарь из индекса поиска ингредиентов."""
+    if isinstance(ingredient, dict):
+        return {
+            'id': ingredient['id'],
+            'name': ingredient['name'],
+            'measurement_unit': ingredient['measurement_unit'],
+        }
+    return {
+        'id': ingredient.id,
+        'name': ingredient.name,
+        'measurement_unit': ingredient.measurement_unit,
+    }
+
+
+def is_subscribed(author, request):
+    if hasattr(author, 'is_subscribed'):
+        return author.is_subscribed
+    user = request.user
+    return user.is_authenticated and user != author and user.follower.filter(
+        author=author).exists()
+
+
+def user_representation(user, request):
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': is_subscribed(user, request),
+    }
+
+
+def portion_representation(portion):
+    ingredient = portion.ingredient
+    return {
+        'id': ingredient.id,
+        'name': ingredient.name,
+        'measurement_unit': ingredient.measurement_unit,
+        'amount': portion.amount,
+    }
+
+
+def recipe_flag(recipe, request, annotation, related_name):
+    """is_favorited и is_in_shopping_cart, как в RecipeReadSerializer."""
+    if hasattr(recipe, annotation):
+        return getattr(recipe, annotation)
+    user = request.user
+    return request and user.is_authenticated and getattr(
+        recipe, related_name
+    ).filter(user=user).exists()
+
+
+def recipe_representation(recipe, request):
+    return {
+        'id': recipe.id,
+        'tags': [tag_representation(tag) for tag in recipe.tags.all()],
+        'author': user_representation(recipe.author, request),
+        'ingredients': [
+            portion_representation(portion)
+            for portion in recipe.ingredient.all()
+        ],
+        'is_favorited': recipe_flag(
+            recipe, request, 'is_favorited', 'favorites'
+        ),
+        'is_in_shopping_cart': recipe_flag(
+            recipe, request, 'is_in_shopping_cart', 'shopping_list'
+        ),
+        'name': recipe.name,
+        'image': file_url(recipe.image, request),
+        'images': rendition_urls(recipe, request),
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def short_recipe_representation(recipe, request):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': file_url(recipe.image, request),
+        'images': rendition_urls(recipe, request),
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+class FastTagSerializer(TagSerializer):
+    def to_representation(self, instance):
+        return tag_representation(instance)
+
+
+class FastIngredientSerializer(IngredientSerializer):
+    def to_representation(self, instance):
+        return ingredient_representation(instance)
+
+
+class FastCustomUserSerializer(CustomUserSerializer):
+    def to_representation(self, instance):
+        return user_representation(instance, self.context.get('request'))
+
+
+class FastRecipeReadSerializer(RecipeReadSerializer):
+    """Представление рецепта без полей и вложенных сериализаторов DRF.
+
+    Словарь строится напрямую из атрибутов выбранного for_read() рецепта
+    и совпадает с представлением RecipeReadSerializer байт в байт, что
+    проверяет команда serializer_benchmark.
+    """
+
+    def to_representation(self, instance):
+        return recipe_representation(instance, self.context.get('request'))
+
+
+class FastRecipeShortSerializer(RecipeShortSerializer):
+    def to_representation(self, instance):
+        return short_recipe_representation(
+            instance, self.context.get('request')
+        )
+
+
+class FastSubscribeListSerializer(SubscribeListSerializer):
+    """Рецепты подписок, как и в SubscribeListSerializer, представлены
+    без запроса в контексте, то есть с относительными ссылками."""
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        data = user_representation(instance, request)
+        data['recipes_count'] = instance.recipes_count
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(instance.id, [])
+        else:
+            recipes = instance.recipes.all()
+            limit = request.GET.get('recipes_limit')
+            if limit:
+                recipes = recipes[: int(limit)]
+        data['recipes'] = [
+            short_recipe_representation(recipe, None) for recipe in recipes
+        ]
+        return data
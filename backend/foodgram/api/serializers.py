@@ -1,16 +1,23 @@
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum, UniqueConstraint
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 
+from api.cache import RECIPES_NAMESPACE, bump_version
+from api.cook_index import cook_index
+from api.fields import (BulkPrimaryKeyRelatedField, ImageRenditionsField,
+                        RecipeImageField, resolve_ids)
+from api.instrumentation import TimedListSerializer, TimedSerializerMixin
+from core.limits import Limits
 from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
-                            ShopingCart, Tag)
+                            ShopingCart, ShoppingListTotal, Tag)
 from users.models import Subscription, User
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор пользователя."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -22,8 +29,11 @@ class CustomUserSerializer(UserSerializer):
         )
         read_only_fields = ('is_subscribed', )
         extra_kwargs = {'password': {'write_only': True}, }
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return user.is_authenticated and user != obj and user.follower.filter(
             author=obj).exists()
@@ -42,7 +52,7 @@ class CustomUserSerializer(UserSerializer):
 
 class SubscribeListSerializer(CustomUserSerializer):
     """Сериализатор для получения подписок."""
-    recipes_count = SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
     recipes = SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
@@ -51,10 +61,12 @@ class SubscribeListSerializer(CustomUserSerializer):
         )
         read_only_fields = ('email', 'username', 'first_name', 'last_name', )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            return RecipeShortSerializer(
+                recipes_by_author.get(obj.id, []), many=True, read_only=True
+            ).data
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
         recipes = obj.recipes.all()
@@ -64,31 +76,88 @@ class SubscribeListSerializer(CustomUserSerializer):
         return serializer.data
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-    """Сериализатор для создания подписки."""
+def lock_user(user_id):
+    """Блокирует строку пользователя до конца транзакции, чтобы изменения
+    его избранного и корзины выполнялись по очереди.
+
+    В SQLite нет SELECT ... FOR UPDATE, а чтение до записи в ней
+    приводит к ошибке database is locked, поэтому блокировка на запись
+    берется пустым UPDATE.
+    """
+    if not connection.features.has_select_for_update:
+        User.objects.filter(pk=user_id).update(id=F('id'))
+        return
+    list(User.objects.select_for_update().filter(
+        pk=user_id
+    ).values_list('pk', flat=True))
+
+
+class UniqueCreateMixin:
+    """Создание связи одной вставкой без предварительной проверки.
+
+    Вставка выполняется в отдельной точке сохранения: повторное
+    добавление, в том числе одновременное, нарушает ограничение
+    уникальности и возвращается ошибкой 400, а не 500. Остальные ошибки
+    целостности, в том числе из after_create, не перехватываются.
+    """
+
+    conflict_message = None
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.before_create(validated_data)
+            try:
+                with transaction.atomic():
+                    instance = super().create(validated_data)
+            except IntegrityError:
+                if not self.conflicts(validated_data):
+                    raise
+                raise ValidationError(
+                    detail=self.conflict_message,
+                    code=status.HTTP_400_BAD_REQUEST,
+                )
+            self.after_create(instance)
+        return instance
+
+    def conflicts(self, validated_data):
+        """Есть ли уже строка с теми же полями ограничения уникальности."""
+        model = self.Meta.model
+        return any(
+            model.objects.filter(**{
+                field: validated_data[field] for field in constraint.fields
+            }).exists()
+            for constraint in model._meta.constraints
+            if isinstance(constraint, UniqueConstraint)
+            and set(constraint.fields) <= validated_data.keys()
+        )
+
+    def before_create(self, validated_data):
+        """Подготовка к вставке в той же транзакции."""
+
+    def after_create(self, instance):
+        """Обновление зависимых данных в той же транзакции."""
+
+
+class SubscribeSerializer(UniqueCreateMixin, TimedSerializerMixin,
+                          serializers.ModelSerializer):
+    """Сериализатор для создания подписки.
+
+    Подписчик и автор передаются в save().
+    """
+    conflict_message = 'Вы уже подписаны на пользователя.'
+
     class Meta:
         model = Subscription
         fields = ('author', 'user',)
+        read_only_fields = ('author', 'user',)
 
-    def validate(self, data):
-        author_id = self.context.get(
-            'request').parser_context.get('kwargs').get('id')
-        author = get_object_or_404(User, id=author_id)
-        user = self.context.get('request').user
-        if user.follower.filter(author=author_id).exists():
-            raise ValidationError(
-                detail='Вы уже подписаны на пользователя.',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
-        if user == author:
+    def create(self, validated_data):
+        if validated_data['user'] == validated_data['author']:
             raise ValidationError(
                 detail='Подписка на себя невозможна.',
                 code=status.HTTP_400_BAD_REQUEST,
             )
-        return data
-
-    def create(self, validated_data):
-        return Subscription.objects.create(**validated_data)
+        return super().create(validated_data)
 
     def to_representation(self, instance):
         return SubscribeListSerializer(
@@ -96,25 +165,31 @@ class SubscribeSerializer(serializers.ModelSerializer):
         ).data
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор полей избранных рецептов и покупок."""
+    images = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time', )
+        fields = ('id', 'name', 'image', 'images', 'cooking_time', )
+        list_serializer_class = TimedListSerializer
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор просмотра тегов."""
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug', )
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор просмотра ингридиентов."""
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit', )
+        list_serializer_class = TimedListSerializer
 
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
@@ -130,7 +205,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount', )
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор просмотра рецепта."""
     tags = TagSerializer(read_only=False, many=True)
     author = CustomUserSerializer(read_only=True, many=False)
@@ -140,48 +215,86 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(max_length=None)
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'images', 'text', 'cooking_time',
         )
+        list_serializer_class = TimedListSerializer
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         user = request.user
         return request and user.is_authenticated and obj.favorites.filter(
             user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         user = request.user
         return request and user.is_authenticated and obj.shopping_list.filter(
             user=user).exists()
 
 
+class IngredientPortionListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта: все ингредиенты получаются одним
+    запросом после проверки отдельных элементов."""
+
+    def to_internal_value(self, data):
+        portions = super().to_internal_value(data)
+        ingredients = resolve_ids(
+            Ingredient.objects.all(),
+            [portion['id'] for portion in portions],
+            'Указанных ингредиентов не существует: {pk_values}.',
+        )
+        for portion, ingredient in zip(portions, ingredients):
+            portion['id'] = ingredient
+        return portions
+
+
 class CreateIngredientPortionSerializer(serializers.ModelSerializer):
     """Сериализатор для получения ингредиентов при создании рецепта."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     class Meta:
         model = AmountIngredients
         fields = ('id', 'amount')
+        list_serializer_class = IngredientPortionListSerializer
+
 
+def match_amounts(rows, amounts):
+    """Строки и количества одного ингредиента, не совпавшие друг с другом."""
+    remaining = list(amounts)
+    unmatched = []
+    for row in rows:
+        if row.amount in remaining:
+            remaining.remove(row.amount)
+        else:
+            unmatched.append(row)
+    return unmatched, remaining
 
-class CreateRecipeSerializer(serializers.ModelSerializer):
+
+class CreateRecipeSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
     ingredients = CreateIngredientPortionSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
-        error_messages={'does_not_exist': 'Указанного тега не существует.'}
+        error_messages={
+            'does_not_exist': 'Указанных тегов не существует: {pk_values}.'
+        }
     )
-    image = Base64ImageField(max_length=None)
+    image = RecipeImageField(max_length=None)
 
     class Meta:
         model = Recipe
@@ -194,10 +307,6 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         if len(set(tags)) != len(tags):
             raise serializers.ValidationError(
                 'Передаваемые тэги не уникальны')
-        for tag in tags:
-            if not Tag.objects.filter(id=tag.id).exists():
-                raise serializers.ValidationError(
-                    'Указанного тега не существует')
         return tags
 
     def validate_cooking_time(self, cooking_time):
@@ -236,6 +345,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
         AmountIngredients.objects.bulk_create(ingredient_list)
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request', None)
         tags = validated_data.pop('tags')
@@ -243,15 +353,94 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(recipe, ingredients)
+        cook_index.schedule_refresh([recipe.id])
         return recipe
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Добавляет и удаляет только изменившиеся теги рецепта."""
+        current = set(recipe.tags.values_list('id', flat=True))
+        wanted = {tag.id for tag in tags}
+        if current - wanted:
+            recipe.tags.remove(*(current - wanted))
+        if wanted - current:
+            recipe.tags.add(*(wanted - current))
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приводит строки ингредиентов рецепта к переданным.
+
+        Совпадающие строки не трогаются, у оставшихся строк того же
+        ингредиента меняется количество, лишние строки удаляются, а
+        недостающие создаются. Возвращает изменение количества каждого
+        ингредиента: {id: разница}.
+        """
+        rows = {}
+        for row in AmountIngredients.objects.filter(
+            recipe=recipe
+        ).order_by('id'):
+            rows.setdefault(row.ingredient_id, []).append(row)
+        wanted = {}
+        for ingredient_data in ingredients:
+            wanted.setdefault(ingredient_data['id'].id, []).append(
+                ingredient_data['amount']
+            )
+        changed, created, deleted = [], [], []
+        deltas = {}
+        for ingredient_id in rows.keys() | wanted.keys():
+            old_rows = rows.get(ingredient_id, [])
+            amounts = wanted.get(ingredient_id, [])
+            deltas[ingredient_id] = sum(amounts) - sum(
+                row.amount for row in old_rows
+            )
+            unmatched, remaining = match_amounts(old_rows, amounts)
+            for row, amount in zip(unmatched, remaining):
+                row.amount = amount
+                changed.append(row)
+            deleted.extend(row.id for row in unmatched[len(remaining):])
+            created.extend(
+                AmountIngredients(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount,
+                )
+                for amount in remaining[len(unmatched):]
+            )
+        if deleted:
+            AmountIngredients.objects.filter(id__in=deleted).delete()
+        if changed:
+            AmountIngredients.objects.bulk_update(changed, ('amount',))
+        if created:
+            AmountIngredients.objects.bulk_create(created)
+        if changed or created:
+            # bulk_update и bulk_create не отправляют сигналы моделей.
+            transaction.on_commit(lambda: bump_version(RECIPES_NAMESPACE))
+        if rows.keys() != wanted.keys():
+            cook_index.schedule_refresh([recipe.id])
+        return deltas
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        AmountIngredients.objects.filter(recipe=instance).delete()
-        instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        if 'tags' in validated_data:
+            self.update_tags(instance, validated_data.pop('tags'))
+        if 'ingredients' in validated_data:
+            deltas = self.update_ingredients(
+                instance, validated_data.pop('ingredients')
+            )
+            if any(deltas.values()):
+                ShoppingListTotal.objects.apply_amounts(
+                    list(instance.shopping_list.values_list(
+                        'user_id', flat=True
+                    )),
+                    deltas,
+                )
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed:
+            instance.save(update_fields=changed)
+        return instance
 
     def to_representation(self, instance):
         return RecipeReadSerializer(instance, context={
@@ -259,20 +448,21 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         }).data
 
 
-class FavouriteSerializer(serializers.ModelSerializer):
-    """ Сериализатор избранных рецептов."""
+class FavouriteSerializer(UniqueCreateMixin, TimedSerializerMixin,
+                          serializers.ModelSerializer):
+    """ Сериализатор избранных рецептов.
+
+    Пользователь и рецепт передаются в save().
+    """
+    conflict_message = 'Рецепт уже добавлен в избранное.'
 
     class Meta:
         model = Favourite
         fields = ('user', 'recipe', )
+        read_only_fields = ('user', 'recipe', )
 
-    def validate(self, data):
-        user = data['user']
-        if user.favorites.filter(recipe=data['recipe']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже добавлен в избранное.'
-            )
-        return data
+    def before_create(self, validated_data):
+        lock_user(validated_data['user'].pk)
 
     def to_representation(self, instance):
         return RecipeShortSerializer(
@@ -281,23 +471,156 @@ class FavouriteSerializer(serializers.ModelSerializer):
         ).data
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка покупок."""
+class ShoppingCartSerializer(UniqueCreateMixin, TimedSerializerMixin,
+                             serializers.ModelSerializer):
+    """Сериализатор для списка покупок.
+
+    Пользователь и рецепт передаются в save().
+    """
+    conflict_message = 'Рецепт уже добавлен в корзину'
 
     class Meta:
         model = ShopingCart
         fields = ('user', 'recipe', )
+        read_only_fields = ('user', 'recipe', )
 
-    def validate(self, data):
-        user = data['user']
-        if user.shopping_list.filter(recipe=data['recipe']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже добавлен в корзину'
-            )
-        return data
+    def before_create(self, validated_data):
+        lock_user(validated_data['user'].pk)
+
+    def after_create(self, instance):
+        ShoppingListTotal.objects.add_recipe(
+            [instance.user_id], instance.recipe
+        )
 
     def to_representation(self, instance):
         return RecipeShortSerializer(
             instance.recipe,
             context={'request': self.context.get('request')}
         ).data
+
+
+class BulkRecipeRelationSerializer(TimedSerializerMixin,
+                                   serializers.Serializer):
+    """Добавление и удаление пачки рецептов в избранном или корзине.
+
+    Все id проверяются одним запросом, связи создаются одной вставкой
+    и удаляются одним запросом, счетчики обновляются только у рецептов,
+    связь с которыми действительно изменилась.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Limits.BULK_RECIPES.value,
+    )
+    model = None
+    counter_field = None
+
+    def validate_ids(self, ids):
+        return resolve_ids(
+            Recipe.objects.only(
+                'id', 'name', 'image', 'renditions', 'cooking_time'
+            ),
+            list(dict.fromkeys(ids)),
+            'Рецепты не найдены: {pk_values}',
+        )
+
+    def links(self, user):
+        return self.model.objects.filter(
+            user=user, recipe__in=self.validated_data['ids']
+        )
+
+    @transaction.atomic
+    def add(self, user):
+        """Создает недостающие связи, возвращает id добавленных рецептов.
+
+        Одиночное и пакетное добавление блокируют строку пользователя,
+        поэтому existing не устаревает до вставки и счетчики не
+        увеличиваются дважды.
+        """
+        lock_user(user.pk)
+        existing = set(self.links(user).values_list('recipe_id', flat=True))
+        added = [
+            recipe.id for recipe in self.validated_data['ids']
+            if recipe.id not in existing
+        ]
+        self.model.objects.bulk_create(
+            (self.model(user=user, recipe_id=recipe_id)
+             for recipe_id in added),
+            ignore_conflicts=True,
+        )
+        self.count_added(added)
+        return added
+
+    @transaction.atomic
+    def remove(self, user):
+        """Удаляет связи, возвращает id исключенных рецептов."""
+        lock_user(user.pk)
+        removed = list(self.links(user).select_for_update().values_list(
+            'recipe_id', flat=True
+        ))
+        self.model.objects.filter(user=user, recipe__in=removed).delete()
+        return removed
+
+    def count_added(self, recipe_ids):
+        """bulk_create не отправляет сигналов, поэтому счетчики
+        добавленных рецептов увеличиваются здесь. Удаление обновляет их
+        в api.signals."""
+        if recipe_ids:
+            Recipe.objects.filter(pk__in=recipe_ids).update(
+                **{self.counter_field: F(self.counter_field) + 1}
+            )
+
+    def to_representation(self, instance):
+        return RecipeShortSerializer(
+            instance, many=True,
+            context={'request': self.context.get('request')},
+        ).data
+
+
+class BulkFavouriteSerializer(BulkRecipeRelationSerializer):
+    """Пачка рецептов для избранного."""
+    model = Favourite
+    counter_field = 'favorites_count'
+
+
+class BulkShoppingCartSerializer(BulkRecipeRelationSerializer):
+    """Пачка рецептов для корзины с обновлением итогов списка покупок."""
+    model = ShopingCart
+    counter_field = 'in_carts_count'
+
+    @transaction.atomic
+    def add(self, user):
+        added = super().add(user)
+        self.apply_totals(user, added, 1)
+        return added
+
+    @transaction.atomic
+    def remove(self, user):
+        removed = super().remove(user)
+        self.apply_totals(user, removed, -1)
+        return removed
+
+    @staticmethod
+    def apply_totals(user, recipe_ids, sign):
+        if not recipe_ids:
+            return
+        ShoppingListTotal.objects.apply_amounts([user.id], {
+            row['ingredient_id']: sign * row['amount']
+            for row in AmountIngredients.objects.filter(
+                recipe__in=recipe_ids
+            ).values('ingredient_id').annotate(
+                amount=Sum('amount')
+            ).order_by()
+        })
+
+
+class CookQuerySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Limits.COOK_INGREDIENTS,
+    )
+    missing = serializers.IntegerField(
+        min_value=0, max_value=Limits.COOK_MAX_MISSING, default=0,
+    )
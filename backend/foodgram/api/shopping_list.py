@@ -0,0 +1,157 @@
+import csv
+import json
+from hashlib import md5
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+FONT_NAME = 'arimo'
+FONT_PATH = settings.BASE_DIR / 'fonts' / 'arimo.ttf'
+TITLE = 'Список покупок'
+TITLE_FONT_SIZE = 24
+TITLE_POSITION = (200, 800)
+LINE_FONT_SIZE = 14
+LINE_HEIGHT = 25
+LEFT_MARGIN = 75
+TOP_MARGIN = 750
+BOTTOM_MARGIN = 50
+SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 8192
+CSV_HEADER = ('name', 'measurement_unit', 'amount')
+
+
+def register_font():
+    """Регистрирует шрифт списка покупок, если он еще не загружен."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def shopping_list_lines(ingredients):
+    """Строки списка покупок из агрегированных ингредиентов."""
+    for serial_number, item in enumerate(ingredients, 1):
+        yield (
+            f'{serial_number}. {item["ingredient__name"]} '
+            f'- {item["amount"]} '
+            f'{item["ingredient__measurement_unit"]}'
+        )
+
+
+def render_pdf(ingredients):
+    """Многостраничный PDF со списком покупок.
+
+    Строки берутся из итератора по мере отрисовки, а готовый документ
+    пишется во временный файл, который уходит на диск при превышении
+    SPOOL_MAX_SIZE. Возвращается файл, перемотанный в начало.
+    """
+    register_font()
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf_file = canvas.Canvas(file)
+    pdf_file.setFont(FONT_NAME, TITLE_FONT_SIZE)
+    pdf_file.drawString(*TITLE_POSITION, TITLE)
+    pdf_file.setFont(FONT_NAME, LINE_FONT_SIZE)
+    height = TOP_MARGIN
+    for line in shopping_list_lines(ingredients):
+        if height < BOTTOM_MARGIN:
+            pdf_file.showPage()
+            pdf_file.setFont(FONT_NAME, LINE_FONT_SIZE)
+            height = TITLE_POSITION[1]
+        pdf_file.drawString(LEFT_MARGIN, height, line)
+        height -= LINE_HEIGHT
+    pdf_file.showPage()
+    pdf_file.save()
+    file.seek(0)
+    return file
+
+
+def shopping_list_etag(ingredients, renderer_format):
+    """ETag списка покупок для конкретного формата выгрузки."""
+    digest = md5(renderer_format.encode())
+    for item in ingredients:
+        digest.update(
+            f'{item["ingredient__name"]}\x1f'
+            f'{item["ingredient__measurement_unit"]}\x1f'
+            f'{item["amount"]}\x1e'.encode()
+        )
+    return f'"{digest.hexdigest()}"'
+
+
+class EchoBuffer:
+    """Буфер, возвращающий записанное значение, для потокового csv."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер выгрузки списка покупок.
+
+    Наследники реализуют stream(), отдающий документ частями. Ответы с
+    ошибками отдаются в JSON, см. RecipeViewSet.finalize_response.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(data))
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        with render_pdf(ingredients) as file:
+            yield from iter(lambda: file.read(CHUNK_SIZE), b'')
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield f'{TITLE}\n\n'.encode(self.charset)
+        for line in shopping_list_lines(ingredients):
+            yield f'{line}\n'.encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(CSV_HEADER).encode(self.charset)
+        for item in ingredients:
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['ingredient__measurement_unit'],
+                item['amount'],
+            )).encode(self.charset)
+
+
+class JSONShoppingListRenderer(JSONRenderer):
+    def stream(self, ingredients):
+        yield json.dumps(
+            [dict(zip(CSV_HEADER, (
+                item['ingredient__name'],
+                item['ingredient__measurement_unit'],
+                item['amount'],
+            ))) for item in ingredients],
+            ensure_ascii=False,
+        ).encode()
+
+
+SHOPPING_LIST_RENDERERS = (
+    PDFShoppingListRenderer,
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
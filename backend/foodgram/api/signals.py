@@ -0,0 +1,163 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_migrate, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens, refresh_cached_fields
+from api.cache import (INGREDIENTS_NAMESPACE, RECIPES_NAMESPACE,
+                       TAGS_NAMESPACE, bump_version)
+from api.cook_index import cook_index
+from api.ingredient_search import ingredient_search
+from recipes.images import image_pipeline
+from recipes.models import (AmountIngredients, Favourite, Ingredient,
+                            Recipe, ShopingCart, ShoppingListTotal,
+                            StoredFile, Tag)
+from recipes.search import create_fts_index
+from users.models import Subscription, User
+
+# Связь: (внешний ключ, модель со счетчиком, поле счетчика).
+COUNTERS = {
+    Recipe: ('author_id', User, 'recipes_count'),
+    Favourite: ('recipe_id', Recipe, 'favorites_count'),
+    ShopingCart: ('recipe_id', Recipe, 'in_carts_count'),
+    Subscription: ('author_id', User, 'followers_count'),
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    ingredient_search.invalidate()
+    transaction.on_commit(lambda: bump_version(INGREDIENTS_NAMESPACE))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS_NAMESPACE))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=AmountIngredients)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache(**kwargs):
+    transaction.on_commit(lambda: bump_version(RECIPES_NAMESPACE))
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(pre_save, sender=User)
+def refresh_cached_user(instance, **kwargs):
+    refresh_cached_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, created, **kwargs):
+    if not created:
+        invalidate_tokens(Token.objects.filter(
+            user=instance
+        ).values_list('key', flat=True))
+
+
+def update_counter(sender, target_id, delta):
+    if target_id is None:
+        return
+    _, model, field = COUNTERS[sender]
+    targets = model.objects.filter(pk=target_id)
+    if delta < 0:
+        targets = targets.filter(**{f'{field}__gt': 0})
+    targets.update(**{field: F(field) + delta})
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=Favourite)
+@receiver(post_init, sender=ShopingCart)
+@receiver(post_init, sender=Subscription)
+def remember_counted_target(sender, instance, **kwargs):
+    instance._counted_target = instance.__dict__.get(COUNTERS[sender][0])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=ShopingCart)
+@receiver(post_save, sender=Subscription)
+def count_relation(sender, instance, created, **kwargs):
+    """Обновляет счетчики при любом создании и смене внешнего ключа:
+    через API, в админке и из кода. bulk_create сигналов не отправляет,
+    его счетчики обновляются отдельно."""
+    target = instance.__dict__.get(COUNTERS[sender][0])
+    previous = None if created else instance._counted_target
+    if target != previous:
+        update_counter(sender, target, 1)
+        update_counter(sender, previous, -1)
+    instance._counted_target = target
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favourite)
+@receiver(post_delete, sender=ShopingCart)
+@receiver(post_delete, sender=Subscription)
+def uncount_relation(sender, instance, **kwargs):
+    update_counter(
+        sender, instance.__dict__.get(COUNTERS[sender][0]), -1
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(instance, **kwargs):
+    """Вычитает рецепт из итогов списков покупок при любом удалении:
+    через API, в админке и каскадом вместе с автором."""
+    ShoppingListTotal.objects.remove_recipe(
+        list(instance.shopping_list.values_list('user_id', flat=True)),
+        instance,
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_cook_index(instance, **kwargs):
+    cook_index.schedule_refresh([instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_renditions(instance, **kwargs):
+    if instance.image and (
+        instance.renditions.get('source') != instance.image.name
+    ):
+        image_pipeline.schedule(instance.pk)
+
+
+def loaded_image_name(recipe):
+    """Имя картинки без обращения к базе, если поле отложено."""
+    image = recipe.__dict__.get('image')
+    return getattr(image, 'name', image)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(instance, **kwargs):
+    instance._stored_image = loaded_image_name(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(instance, created, **kwargs):
+    name = instance.image.name
+    previous = None if created else instance._stored_image
+    if name != previous:
+        StoredFile.objects.acquire(name)
+        StoredFile.objects.release(previous)
+    instance._stored_image = name
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(instance, **kwargs):
+    StoredFile.objects.release(loaded_image_name(instance))
+
+
+@receiver(post_migrate)
+def create_recipe_search_index(app_config, using, **kwargs):
+    if app_config.name == 'recipes':
+        create_fts_index(connections[using])
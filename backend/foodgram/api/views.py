@@ -1,37 +1,65 @@
-import io
+from functools import partial
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.core.exceptions import ValidationError
+from django.http import (Http404, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api.cache import (INGREDIENTS_NAMESPACE, RECIPES_NAMESPACE,
+                       TAGS_NAMESPACE, VersionedCacheMixin, cached_response)
+from api.cook_index import cook_index
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPagination
+from api.pagination import (CustomPagination, RecipeKeysetPagination,
+                            SelectablePaginationMixin, UserKeysetPagination)
 from api.permissions import AuthorOnlyPermission
-from api.serializers import (CreateRecipeSerializer, CustomUserSerializer,
-                             FavouriteSerializer, IngredientSerializer,
-                             RecipeReadSerializer, ShoppingCartSerializer,
-                             SubscribeListSerializer, SubscribeSerializer,
-                             TagSerializer)
-from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
-                            ShopingCart, Tag)
+from api.serializers import (BulkFavouriteSerializer,
+                             BulkShoppingCartSerializer, CookQuerySerializer,
+                             CreateRecipeSerializer, CustomUserSerializer,
+                             FavouriteSerializer, ShoppingCartSerializer,
+                             SubscribeSerializer, lock_user)
+from api.representations import (FastIngredientSerializer,
+                                 FastRecipeReadSerializer,
+                                 FastSubscribeListSerializer,
+                                 FastTagSerializer)
+from api.shopping_list import SHOPPING_LIST_RENDERERS, shopping_list_etag
+from recipes.models import (Favourite, Ingredient, Recipe, ShopingCart,
+                            ShoppingListTotal, Tag)
 from users.models import Subscription, User
 
 
-class CustomUserViewSet(UserViewSet):
+def delete_or_404(model, **filters):
+    """Удаляет строки, 404 — если удалять нечего.
+
+    Счетчики уменьшаются в post_delete даже для строки, которую уже
+    удалил параллельный запрос, поэтому перед удалением связей
+    пользователя его строка блокируется через lock_user.
+    """
+    try:
+        deleted, _ = model.objects.filter(**filters).delete()
+    except (TypeError, ValueError, ValidationError):
+        raise Http404
+    if not deleted:
+        raise Http404
+
+
+class CustomUserViewSet(SelectablePaginationMixin, UserViewSet):
     """Представление для модели User."""
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    keyset_pagination_class = UserKeysetPagination
 
     @action(
         detail=True,
@@ -40,103 +68,143 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, pk=id)
 
         if request.method == 'POST':
+            author = get_object_or_404(User, pk=id)
             serializer = SubscribeSerializer(
-                data={'author': author.id, 'user': user.id},
-                context={'request': request}
+                data={}, context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            serializer.save(user=user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        get_object_or_404(
-            Subscription, user=user, author=author
-        ).delete()
+        with transaction.atomic():
+            lock_user(user.pk)
+            delete_or_404(Subscription, user=user, author=id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
         pages = self.paginate_queryset(queryset)
-        serializer = SubscribeListSerializer(
-            pages, many=True, context={'request': request}
+        limit = request.query_params.get('recipes_limit')
+        recipes_by_author = Recipe.objects.latest_by_author(
+            [author.id for author in pages], int(limit) if limit else None
+        )
+        serializer = FastSubscribeListSerializer(
+            pages, many=True, context={
+                'request': request,
+                'recipes_by_author': recipes_by_author,
+            }
         )
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Представление для модели Ingredient."""
-    serializer_class = IngredientSerializer
+    cache_namespace = INGREDIENTS_NAMESPACE
+    serializer_class = FastIngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, )
     filter_backends = (IngredientFilter, )
-    search_fields = ('name', )
     pagination_class = None
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Представление для модели Tag."""
+    cache_namespace = TAGS_NAMESPACE
     queryset = Tag.objects.all()
-    serializer_class = TagSerializer
+    serializer_class = FastTagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
     """Представление для модели Recipe."""
     queryset = Recipe.objects.all()
     serializer_class = CreateRecipeSerializer
     permission_classes = (AuthorOnlyPermission, )
     pagination_class = CustomPagination
+    keyset_pagination_class = RecipeKeysetPagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
 
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, RECIPES_NAMESPACE, partial(
+            super().list, request, *args, **kwargs
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, RECIPES_NAMESPACE, partial(
+            super().retrieve, request, *args, **kwargs
+        ))
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Recipe.objects.for_read(self.request.user)
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
-            return RecipeReadSerializer
+            return FastRecipeReadSerializer
         return CreateRecipeSerializer
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Ошибки выгрузки, в том числе неизвестный ?format=, отдаются в
+        # JSON, а не рендерером файла из согласования Accept.
+        if (
+            self.action == 'download_shopping_cart'
+            and getattr(response, 'exception', False)
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     @action(
         detail=False, methods=['GET'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart(self, request):
-        ingredients = AmountIngredients.objects.filter(
-            recipe__shopping_list__user=request.user
+        ingredients = list(ShoppingListTotal.objects.filter(
+            user=request.user
         ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        pdfmetrics.registerFont(
-            TTFont(
-                'arimo',
-                'fonts/arimo.ttf'
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ))
+        renderer = request.accepted_renderer
+        etag = shopping_list_etag(ingredients, renderer.format)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = StreamingHttpResponse(
+                renderer.stream(ingredients), content_type=content_type
             )
-        )
-        buffer = io.BytesIO()
-        pdf_file = canvas.Canvas(buffer)
-        pdf_file.setFont('arimo', 24)
-        pdf_file.drawString(200, 800, 'Список покупок')
-        pdf_file.setFont('arimo', 14)
-        height = 750
-        width = 75
-        for serial_number, item in enumerate(ingredients, 1):
-            pdf_file.drawString(width, height, (
-                f'{serial_number}. {item["ingredient__name"]} '
-                f'- {item["amount"]} '
-                f'{item["ingredient__measurement_unit"]}')
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping_list.{renderer.format}"'
             )
-            height -= 25
-        pdf_file.showPage()
-        pdf_file.save()
-        buffer.seek(0)
-        return FileResponse(
-            buffer,
-            as_attachment=True,
-            filename="shopping_list.pdf"
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    @action(detail=False, methods=('GET',))
+    def what_can_i_cook(self, request):
+        """Рецепты из имеющихся ингредиентов по индексу cook_index."""
+        query = CookQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        recipe_ids = cook_index.search(**query.validated_data)
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(recipe_ids, request, view=self)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True
         )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(
         detail=True,
@@ -145,24 +213,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk):
         context = {'request': request}
         recipe = get_object_or_404(Recipe, id=pk)
-        data = {
-            'user': request.user.id,
-            'recipe': recipe.id
-        }
-        serializer = ShoppingCartSerializer(data=data, context=context)
+        serializer = ShoppingCartSerializer(data={}, context=context)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(user=request.user, recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def destroy_shopping_cart(self, request, pk):
-        get_object_or_404(
-            ShopingCart,
-            user=request.user.id,
-            recipe=get_object_or_404(Recipe, id=pk)
-        ).delete()
+        lock_user(request.user.pk)
+        delete_or_404(ShopingCart, user=request.user, recipe=pk)
+        ShoppingListTotal.objects.remove_recipe(
+            [request.user.id], Recipe(pk=pk)
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('POST',),
+        url_path='shopping_cart',
+        permission_classes=[IsAuthenticated])
+    def bulk_shopping_cart(self, request):
+        return self.bulk_add(request, BulkShoppingCartSerializer)
+
+    @bulk_shopping_cart.mapping.delete
+    def bulk_destroy_shopping_cart(self, request):
+        return self.bulk_remove(request, BulkShoppingCartSerializer)
+
     @action(
         detail=True,
         methods=('POST',),
@@ -170,20 +247,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         context = {"request": request}
         recipe = get_object_or_404(Recipe, id=pk)
-        data = {
-            'user': request.user.id,
-            'recipe': recipe.id
-        }
-        serializer = FavouriteSerializer(data=data, context=context)
+        serializer = FavouriteSerializer(data={}, context=context)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(user=request.user, recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def destroy_favorite(self, request, pk):
-        get_object_or_404(
-            Favourite,
-            user=request.user,
-            recipe=get_object_or_404(Recipe, id=pk)
-        ).delete()
+        lock_user(request.user.pk)
+        delete_or_404(Favourite, user=request.user, recipe=pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=('POST',),
+        url_path='favorite',
+        permission_classes=[IsAuthenticated])
+    def bulk_favorite(self, request):
+        return self.bulk_add(request, BulkFavouriteSerializer)
+
+    @bulk_favorite.mapping.delete
+    def bulk_destroy_favorite(self, request):
+        return self.bulk_remove(request, BulkFavouriteSerializer)
+
+    @staticmethod
+    def bulk_add(request, serializer_class):
+        serializer = serializer_class(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.add(request.user)
+        return Response(
+            serializer.to_representation(serializer.validated_data['ids']),
+            status=status.HTTP_201_CREATED,
+        )
+
+    @staticmethod
+    def bulk_remove(request, serializer_class):
+        serializer = serializer_class(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.remove(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
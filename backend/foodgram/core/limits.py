@@ -11,3 +11,7 @@ class Limits(IntEnum):
     MIN_COOKING_TIME = 1
     MAX_COOKING_TIME = 600
     MIN_INGREDIENTS_AMOUNT = 1
+    INGREDIENT_SEARCH_RESULTS = 50
+    BULK_RECIPES = 100
+    COOK_INGREDIENTS = 50
+    COOK_MAX_MISSING = 3
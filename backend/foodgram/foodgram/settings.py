@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +80,73 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+
+REFERENCE_CACHE_MAX_AGE = int(os.getenv('REFERENCE_CACHE_MAX_AGE', default=60))
+
+TRENDING_HALF_LIFE_HOURS = float(
+    os.getenv('TRENDING_HALF_LIFE_HOURS', default=72)
+)
+
+# SQLite не допускает одновременной записи из фонового потока и запроса,
+# поэтому с ней картинки по умолчанию обрабатываются сразу после фиксации.
+IMAGE_WORKERS = int(os.getenv(
+    'IMAGE_WORKERS',
+    default=0 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 2,
+))
+
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', default=10 * 1024 * 1024)
+)
+
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', default=40000000))
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=300))
+
+# Удаление токена или отключение пользователя другие процессы замечают
+# не позже, чем через столько секунд.
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv('TOKEN_CACHE_LOCAL_TTL', default=30))
+
+TOKEN_CACHE_LOCAL_SIZE = int(
+    os.getenv('TOKEN_CACHE_LOCAL_SIZE', default=10000)
+)
+
+# Базовые результаты api_benchmark зависят от машины и хранятся вне
+# репозитория.
+API_BENCHMARK_BASELINE = Path(os.getenv(
+    'API_BENCHMARK_BASELINE',
+    default=Path.home() / '.cache' / 'foodgram' / 'api_benchmark.json',
+))
+
+REQUEST_METRICS_LOG = bool(os.getenv('REQUEST_METRICS_LOG', default=False))
+
+REQUEST_METRICS_DUPLICATE_THRESHOLD = int(
+    os.getenv('REQUEST_METRICS_DUPLICATE_THRESHOLD', default=5)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.instrumentation': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -93,7 +161,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
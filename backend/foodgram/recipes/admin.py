@@ -1,11 +1,13 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import mark_safe
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from api.cook_index import cook_index
 from core.texts import EMPTY_STRING
 from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
-                            ShopingCart, Tag)
+                            ShopingCart, ShoppingListTotal, Tag)
 
 
 class IngredientUpload(resources.ModelResource):
@@ -36,7 +38,9 @@ class AmountIngredientsInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'short_image', )
+    list_display = (
+        'name', 'author', 'short_image', 'favorites_count', 'in_carts_count',
+    )
     fields = (
         'name', 'cooking_time',
         'author', 'tags',
@@ -51,9 +55,29 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags',)
     empty_value_display = EMPTY_STRING
 
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        previous = recipe.ingredient_amounts() if change else {}
+        super().save_related(request, form, formsets, change)
+        amounts = recipe.ingredient_amounts()
+        ShoppingListTotal.objects.apply_amounts(
+            list(recipe.shopping_list.values_list('user_id', flat=True)),
+            {
+                ingredient_id: (
+                    amounts.get(ingredient_id, 0)
+                    - previous.get(ingredient_id, 0)
+                )
+                for ingredient_id in amounts.keys() | previous.keys()
+            },
+        )
+        cook_index.schedule_refresh([recipe.pk])
+
     @admin.display(description='Иконка')
     def short_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="80" height="60">')
+        url = obj.image.url
+        if obj.renditions.get('source') == obj.image.name:
+            url = obj.image.storage.url(obj.renditions['thumbnail']['jpeg'])
+        return mark_safe(f'<img src={url} width="80" height="60">')
 
 
 @admin.register(Tag)
@@ -70,6 +94,35 @@ class FavouriteAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShopingCart)
-class ShopingCart(admin.ModelAdmin):
+class ShopingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
     search_fields = ('user', 'recipe',)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            previous = ShopingCart.objects.select_related('recipe').get(
+                pk=obj.pk
+            )
+            ShoppingListTotal.objects.remove_recipe(
+                [previous.user_id], previous.recipe
+            )
+        super().save_model(request, obj, form, change)
+        ShoppingListTotal.objects.add_recipe([obj.user_id], obj.recipe)
+
+    def delete_model(self, request, obj):
+        ShoppingListTotal.objects.remove_recipe([obj.user_id], obj.recipe)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for cart in queryset.select_related('recipe'):
+            ShoppingListTotal.objects.remove_recipe(
+                [cart.user_id], cart.recipe
+            )
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingListTotal)
+class ShoppingListTotalAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount',)
+    search_fields = ('user__username',)
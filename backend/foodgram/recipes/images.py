@@ -0,0 +1,181 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from api.cache import RECIPES_NAMESPACE, bump_version
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'images/renditions'
+RENDITIONS = {
+    'full': (1600, 1200),
+    'card': (600, 450),
+    'thumbnail': (160, 120),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+BACKGROUND = (255, 255, 255)
+BENCHMARK_IMAGE = ('images/benchmark.png', (640, 480), (200, 120, 80))
+
+
+class ImageTooLarge(ValueError):
+    """Картинка больше допустимого числа пикселей."""
+
+
+def rendition_name(name, rendition, extension):
+    return (
+        f'{RENDITIONS_DIR}/{PurePosixPath(name).stem}_{rendition}.{extension}'
+    )
+
+
+def check_pixels(image):
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Картинка {width}x{height} больше '
+            f'{settings.IMAGE_MAX_PIXELS} пикселей.'
+        )
+
+
+def open_image(file):
+    """Открывает картинку, декодируя не больше, чем нужно для самой
+    крупной копии.
+
+    Размер проверяется по заголовку до декодирования, а JPEG
+    декодируется сразу в уменьшенном масштабе через draft().
+    """
+    image = Image.open(file)
+    check_pixels(image)
+    image.draft('RGB', RENDITIONS['full'])
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_renditions(name, overwrite=False):
+    """Сохраняет копии картинки всех размеров и форматов.
+
+    Возвращает {'source': имя оригинала, размер: {формат: имя файла}}.
+    Имена копий производны от имени оригинала, поэтому копии одинаковых
+    картинок из хранилища по содержимому строятся один раз. Каждая
+    следующая копия уменьшается из предыдущей.
+    """
+    paths = {
+        rendition: {
+            extension: rendition_name(name, rendition, extension)
+            for extension in FORMATS
+        }
+        for rendition in RENDITIONS
+    }
+    if overwrite or not all(
+        default_storage.exists(path)
+        for files in paths.values() for path in files.values()
+    ):
+        with default_storage.open(name, 'rb') as file:
+            image = open_image(file)
+        for rendition, size in RENDITIONS.items():
+            image.thumbnail(size, Image.LANCZOS)
+            for extension, (image_format, options) in FORMATS.items():
+                buffer = BytesIO()
+                image.save(buffer, image_format, **options)
+                path = paths[rendition][extension]
+                default_storage.delete(path)
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+    return {'source': name, **paths}
+
+
+def save_generated_image(name, size, color):
+    """Сохраняет одноцветную PNG-картинку и ее копии.
+
+    Возвращает (имя файла, renditions). Рецепт, созданный с готовыми
+    renditions, не ставится в очередь обработки картинок.
+    """
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    name = Recipe._meta.get_field('image').storage.save(
+        name, ContentFile(buffer.getvalue(), name=PurePosixPath(name).name)
+    )
+    return name, build_renditions(name)
+
+
+def benchmark_image():
+    """Картинка рецептов, которые создают замеры и нагрузочные проверки."""
+    return save_generated_image(*BENCHMARK_IMAGE)
+
+
+def process_recipe_image(recipe_id, overwrite=False):
+    """Строит копии картинки рецепта, если они устарели."""
+    try:
+        recipe = Recipe.objects.only('image', 'renditions').get(pk=recipe_id)
+        name = recipe.image.name
+        if not name or recipe.renditions.get('source') == name:
+            return
+        renditions = build_renditions(name, overwrite)
+        if Recipe.objects.filter(pk=recipe_id, image=name).update(
+            renditions=renditions
+        ):
+            bump_version(RECIPES_NAMESPACE)
+    except Recipe.DoesNotExist:
+        return
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception(
+            'Не удалось обработать картинку рецепта %s', recipe_id
+        )
+
+
+def process_in_worker(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connection.close()
+
+
+class ImagePipeline:
+    """Фоновая обработка картинок рецептов в пуле потоков процесса.
+
+    Pillow освобождает GIL при декодировании, масштабировании и
+    кодировании, поэтому потоки работают параллельно, не занимая
+    обработчики запросов. При IMAGE_WORKERS = 0 картинки обрабатываются
+    сразу в вызывающем потоке.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images',
+                )
+            return self.executor
+
+    def schedule(self, recipe_id):
+        """Ставит рецепт в очередь после фиксации транзакции."""
+        transaction.on_commit(lambda: self.submit(recipe_id))
+
+    def submit(self, recipe_id):
+        if settings.IMAGE_WORKERS <= 0:
+            process_recipe_image(recipe_id)
+            return
+        self.get_executor().submit(process_in_worker, recipe_id)
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии картинок рецептов, у которых их нет или '
+        'они устарели, в текущем процессе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии всех картинок.',
+        )
+
+    def handle(self, *args, **options):
+        if options['force']:
+            Recipe.objects.exclude(renditions={}).update(renditions={})
+        stale = [
+            recipe_id
+            for recipe_id, image, renditions in Recipe.objects.values_list(
+                'id', 'image', 'renditions'
+            ).iterator()
+            if image and renditions.get('source') != image
+        ]
+        for recipe_id in stale:
+            process_recipe_image(recipe_id, overwrite=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(stale)}.'
+        ))
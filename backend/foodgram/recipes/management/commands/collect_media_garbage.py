@@ -0,0 +1,109 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from recipes.images import FORMATS, RENDITIONS, rendition_name
+from recipes.models import Recipe, StoredFile
+
+MEDIA_DIR = 'images'
+MIN_AGE = 3600
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT картинки рецептов и их уменьшенные копии, '
+        'счетчик ссылок StoredFile которых равен нулю, и файлы без '
+        'счетчика. С --sync-references счетчики сначала сверяются с '
+        'таблицей рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=MIN_AGE,
+            help='Не удалять файлы моложе стольких секунд: картинка может '
+                 'быть записана до фиксации транзакции рецепта.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--sync-references', action='store_true',
+            help='Пересчитать счетчики ссылок по рецептам, например после '
+                 'изменения картинок запросами update() в обход сигналов.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = 0
+        if options['sync_references'] and not options['dry_run']:
+            fixed = self.sync_references(Counter(
+                Recipe.objects.exclude(image='').values_list(
+                    'image', flat=True
+                )
+            ))
+        live = set()
+        for name in StoredFile.objects.filter(
+            references__gt=0
+        ).values_list('name', flat=True):
+            live.add(name)
+            live.update(
+                rendition_name(name, rendition, extension)
+                for rendition in RENDITIONS for extension in FORMATS
+            )
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(MEDIA_DIR):
+            return
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        removed = []
+        freed = 0
+        for path in walk(storage, MEDIA_DIR):
+            if path in live or storage.get_modified_time(path) > threshold:
+                continue
+            removed.append(path)
+            freed += storage.size(path)
+            if options['dry_run']:
+                self.stdout.write(path)
+            else:
+                storage.delete(path)
+        if not options['dry_run']:
+            StoredFile.objects.filter(
+                references=0, name__in=removed
+            ).delete()
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {len(removed)} ({filesizeformat(freed)}), '
+            f'исправлено счетчиков ссылок: {fixed}.'
+        ))
+
+    @staticmethod
+    @transaction.atomic
+    def sync_references(references):
+        """Приводит StoredFile к фактическому числу ссылок."""
+        stored = {
+            stored_file.name: stored_file
+            for stored_file in StoredFile.objects.select_for_update()
+        }
+        changed = []
+        for name, stored_file in stored.items():
+            if stored_file.references != references.get(name, 0):
+                stored_file.references = references.get(name, 0)
+                changed.append(stored_file)
+        StoredFile.objects.bulk_update(changed, ('references',))
+        StoredFile.objects.bulk_create(
+            StoredFile(name=name, references=count)
+            for name, count in references.items() if name not in stored
+        )
+        return len(changed) + len(references.keys() - stored.keys())
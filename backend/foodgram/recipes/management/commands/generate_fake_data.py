@@ -0,0 +1,197 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max
+
+from api.cache import RECIPES_NAMESPACE, bump_version
+from core.limits import Limits
+from recipes.images import save_generated_image
+from recipes.management.commands.load_data import batches
+from recipes.models import (AmountIngredients, Favourite, Ingredient, Recipe,
+                            ShopingCart, StoredFile, Tag)
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+PASSWORD = 'fake-password'
+IMAGE_SIZE = (800, 600)
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'паста',
+    'котлеты', 'блины', 'омлет', 'плов', 'борщ', 'соус', 'десерт',
+)
+
+
+def unique_pairs(rng, left, right, count, distinct=False):
+    """Случайные неповторяющиеся пары (left, right), не больше возможных."""
+    possible = len(left) * len(right) - (
+        len(set(left) & set(right)) if distinct else 0
+    )
+    pairs = set()
+    while len(pairs) < min(count, possible):
+        pair = (rng.choice(left), rng.choice(right))
+        if not (distinct and pair[0] == pair[1]):
+            pairs.add(pair)
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает пачками синтетических пользователей, рецепты с '
+        'ингредиентами и тегами, избранное, корзины и подписки для замеров '
+        'на объемах, близких к боевым. Ингредиенты и теги должны быть '
+        'загружены заранее командой load_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, nargs=2, default=(1, 3),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument(
+            '--images', type=int, default=5,
+            help='Количество разных картинок рецептов.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--prefix', default='fake',
+            help='Префикс имен создаваемых пользователей.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Нет ингредиентов или тегов: сначала выполните load_data.'
+            )
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        images = self.create_images(options['images'])
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'], options['prefix'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, images
+            )
+            self.create_recipe_relations(
+                recipe_ids, ingredient_ids, tag_ids,
+                options['ingredients_per_recipe'], options['tags_per_recipe'],
+            )
+            for model, first, second, option in (
+                (Favourite, 'user_id', 'recipe_id', 'favorites'),
+                (ShopingCart, 'user_id', 'recipe_id', 'carts'),
+            ):
+                self.create(model, (
+                    model(**{first: user_id, second: recipe_id})
+                    for user_id, recipe_id in unique_pairs(
+                        self.rng, user_ids, recipe_ids, options[option]
+                    )
+                ))
+            self.create(Subscription, (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id, author_id in unique_pairs(
+                    self.rng, user_ids, user_ids, options['subscriptions'],
+                    distinct=True,
+                )
+            ))
+            call_command('recount_counters', stdout=self.stdout)
+            call_command('rebuild_shopping_lists', stdout=self.stdout)
+            transaction.on_commit(lambda: bump_version(RECIPES_NAMESPACE))
+
+    def create(self, model, objects):
+        """Вставляет объекты пачками и сообщает скорость вставки."""
+        started = time.perf_counter()
+        created = 0
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {created} за {elapsed:.2f} с '
+            f'({created / elapsed if elapsed else 0:.0f} строк/с)'
+        )
+
+    def create_images(self, count):
+        """Сохраняет одноцветные картинки и их уменьшенные копии."""
+        return [
+            save_generated_image('images/fake.png', IMAGE_SIZE, tuple(
+                self.rng.randrange(256) for _ in range(3)
+            ))
+            for _ in range(count)
+        ]
+
+    def create_users(self, count, prefix):
+        offset = User.objects.filter(username__startswith=f'{prefix}_').count()
+        password = make_password(PASSWORD)
+        self.create(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name=f'Имя{number}', last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(offset, offset + count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids, images):
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        chosen = [self.rng.choice(images) for _ in range(count)]
+        self.create(Recipe, (
+            Recipe(
+                author_id=self.rng.choice(user_ids),
+                name=f'{self.rng.choice(WORDS).capitalize()} {number}',
+                text=' '.join(self.rng.choices(WORDS, k=30)),
+                image=image, renditions=renditions,
+                cooking_time=self.rng.randint(
+                    Limits.MIN_COOKING_TIME, 180
+                ),
+            )
+            for number, (image, renditions) in enumerate(chosen)
+        ))
+        for image, _ in images:
+            references = sum(name == image for name, _ in chosen)
+            if not references:
+                continue
+            StoredFile.objects.get_or_create(name=image)
+            StoredFile.objects.filter(name=image).update(
+                references=F('references') + references
+            )
+        return list(Recipe.objects.filter(
+            id__gt=last_id
+        ).values_list('id', flat=True))
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids,
+                                ingredients_range, tags_range):
+        self.create(AmountIngredients, (
+            AmountIngredients(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rng.sample(ingredient_ids, min(
+                self.rng.randint(*ingredients_range), len(ingredient_ids)
+            ))
+        ))
+        through = Recipe.tags.through
+        self.create(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(tag_ids, min(
+                self.rng.randint(*tags_range), len(tag_ids)
+            ))
+        ))
@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import INGREDIENTS_NAMESPACE, TAGS_NAMESPACE, bump_version
+from recipes.models import Ingredient, Tag
+
+DATA_DIR = Path(settings.BASE_DIR).parent.parent / 'data'
+BATCH_SIZE = 5000
+READ_SIZE = 64 * 1024
+FIELDS = {
+    Ingredient: ('name', 'measurement_unit'),
+    Tag: ('name', 'color', 'slug'),
+}
+NAMESPACES = {
+    Ingredient: INGREDIENTS_NAMESPACE,
+    Tag: TAGS_NAMESPACE,
+}
+
+
+def read_csv(file, fields):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(file, fields):
+    """Объекты JSON-массива по одному, без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            position = skip_separators(buffer, position, started)
+            started = True
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield {field: str(item[field]).strip() for field in fields}
+
+
+def skip_separators(buffer, position, started):
+    separators = ' \t\r\n,' + ('' if started else '[')
+    while position < len(buffer) and buffer[position] in separators:
+        position += 1
+    return position
+
+
+def batches(items, size):
+    items = iter(items)
+    batch = list(islice(items, size))
+    while batch:
+        yield batch
+        batch = list(islice(items, size))
+
+
+class CSVStream(io.RawIOBase):
+    """Файлоподобный поток строк в формате CSV для COPY FROM STDIN."""
+
+    def __init__(self, rows, fields):
+        self.lines = self.encode(rows, fields)
+        self.buffer = bytearray()
+        self.rows_read = 0
+
+    def encode(self, rows, fields):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for row in rows:
+            self.rows_read += 1
+            writer.writerow([row[field] for field in fields])
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate()
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        del self.buffer[:size]
+        return size
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты и теги из файлов CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients', type=Path,
+            default=DATA_DIR / 'ingredients.csv',
+            help='Файл ингредиентов: CSV (название, единица) или JSON.',
+        )
+        parser.add_argument(
+            '--tags', type=Path, default=DATA_DIR / 'tags.json',
+            help='Файл тегов: CSV (название, цвет, слаг) или JSON.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одной вставке.',
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загружать ингредиенты через COPY (только PostgreSQL).',
+        )
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('COPY поддерживается только в PostgreSQL.')
+        for model, path in (
+            (Ingredient, options['ingredients']),
+            (Tag, options['tags']),
+        ):
+            self.load(
+                model, path, options['batch_size'],
+                options['copy'] and model is Ingredient,
+            )
+
+    def load(self, model, path, batch_size, use_copy):
+        if path.suffix not in ('.csv', '.json'):
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        reader = read_csv if path.suffix == '.csv' else read_json
+        fields = FIELDS[model]
+        count_before = model.objects.count()
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = reader(file, fields)
+            with transaction.atomic():
+                if use_copy:
+                    read = self.copy_ingredients(rows)
+                else:
+                    read = 0
+                    for batch in batches(rows, batch_size):
+                        model.objects.bulk_create(
+                            (model(**row) for row in batch),
+                            ignore_conflicts=True,
+                        )
+                        read += len(batch)
+        elapsed = time.perf_counter() - started
+        created = model.objects.count() - count_before
+        if created:
+            bump_version(NAMESPACES[model])
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: прочитано {read}, '
+            f'добавлено {created} за {elapsed:.2f} с '
+            f'({read / elapsed if elapsed else 0:.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def copy_ingredients(rows):
+        """Загружает ингредиенты во временную таблицу через COPY и
+        переносит новые строки с пропуском дублей по
+        unique_name_measurement_unit."""
+        table = Ingredient._meta.db_table
+        stream = CSVStream(rows, FIELDS[Ingredient])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_staging '
+                '(name varchar, measurement_unit varchar) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_staging '
+                'ON CONFLICT ON CONSTRAINT unique_name_measurement_unit '
+                'DO NOTHING'
+            )
+        return stream.rows_read
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги списков покупок по корзинам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить итоги, не изменяя их.',
+        )
+
+    def handle(self, *args, **options):
+        expected = ShoppingListTotal.objects.calculate()
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        mismatched = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        if options['check']:
+            if mismatched:
+                raise CommandError(
+                    f'Расхождений в итогах списков покупок: {len(mismatched)}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги списков покупок согласованы: {len(actual)} строк.'
+            ))
+            return
+        # Расхождения, найденные без блокировок, могли исправиться сами,
+        # поэтому итоги каждого пользователя пересчитываются под
+        # блокировкой заново.
+        fixed = sum(
+            ShoppingListTotal.objects.rebuild(user_id)
+            for user_id in sorted({user_id for user_id, _ in mismatched})
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги списков покупок пересчитаны: {len(expected)} строк, '
+            f'исправлено {fixed}.'
+        ))
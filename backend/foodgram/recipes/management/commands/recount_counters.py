@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favourite, Recipe, ShopingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favourite, 'recipe'),
+    (Recipe, 'in_carts_count', ShopingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def actual_count(related_model, field):
+    """Подзапрос с фактическим количеством связанных строк."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет и пересчитывает счетчики избранного, корзин, рецептов '
+        'и подписчиков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счетчики, не изменяя их.',
+        )
+
+    def handle(self, *args, **options):
+        mismatched_total = 0
+        with transaction.atomic():
+            for model, counter, related_model, field in COUNTERS:
+                actual = actual_count(related_model, field)
+                mismatched = model.objects.annotate(actual=actual).exclude(
+                    **{counter: F('actual')}
+                ).count()
+                mismatched_total += mismatched
+                if mismatched and not options['check']:
+                    model.objects.update(**{counter: actual})
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}.{counter}: '
+                    f'расхождений {mismatched}'
+                )
+        if options['check'] and mismatched_total:
+            raise CommandError(f'Расхождений в счетчиках: {mismatched_total}')
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import RECIPES_NAMESPACE, bump_version
+from recipes.models import Favourite, Recipe
+
+WINDOW_HALF_LIVES = 10
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярность рецептов за последнее время: '
+        'каждое добавление в избранное весит 0.5 ** (возраст / период '
+        'полураспада).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float,
+            default=settings.TRENDING_HALF_LIFE_HOURS,
+            help='Период полураспада веса в часах.',
+        )
+
+    def handle(self, *args, **options):
+        half_life = timedelta(hours=options['half_life'])
+        now = timezone.now()
+        scores = defaultdict(float)
+        for recipe_id, created in Favourite.objects.filter(
+            created__gte=now - half_life * WINDOW_HALF_LIVES
+        ).values_list('recipe_id', 'created').iterator():
+            scores[recipe_id] += 0.5 ** ((now - created) / half_life)
+        with transaction.atomic():
+            reset = Recipe.objects.filter(trending_score__gt=0).exclude(
+                pk__in=list(scores)
+            ).update(trending_score=0)
+            Recipe.objects.bulk_update(
+                (
+                    Recipe(pk=recipe_id, trending_score=score)
+                    for recipe_id, score in scores.items()
+                ),
+                ('trending_score',), batch_size=BATCH_SIZE,
+            )
+        transaction.on_commit(lambda: bump_version(RECIPES_NAMESPACE))
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность пересчитана: {len(scores)} рецептов, '
+            f'обнулено {reset}.'
+        ))
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.19 on 2026-10-18 17:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_favourite_created(apps, schema_editor):
+    """Дата добавления существующего избранного неизвестна, ставится
+    дата публикации рецепта, а не время применения миграции."""
+    Favourite = apps.get_model('recipes', 'Favourite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favourite.objects.update(created=models.Subquery(
+        Recipe.objects.filter(
+            pk=models.OuterRef('recipe_id')
+        ).values('pub_date')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favourite',
+            name='created',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Дата добавления'),
+        ),
+        migrations.RunPython(fill_favourite_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='favourite',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность за последнее время'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-pub_date', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time', '-pub_date', '-id'], name='recipe_cooking_time_idx'),
+        ),
+    ]
@@ -1,16 +1,28 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db.models import (CASCADE, CharField, DateTimeField, ForeignKey,
-                              ImageField, ManyToManyField, Model,
-                              PositiveSmallIntegerField, SlugField, TextField,
-                              UniqueConstraint)
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import (CASCADE, DO_NOTHING, BooleanField, CharField,
+                              DateTimeField, Exists, F, FloatField,
+                              ForeignKey, ImageField, Index, JSONField,
+                              ManyToManyField, Model, OneToOneField, OuterRef,
+                              PositiveIntegerField, PositiveSmallIntegerField,
+                              Prefetch, QuerySet, SlugField, Sum, TextField,
+                              UniqueConstraint, Value, Window)
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
 from api.validators import validate_clean_text
 from core.limits import Limits
 from core.texts import (HELP_TEXT_FOR_COOKING_TIME, HELP_TEXT_FOR_HEX_COLOR,
                         HELP_TEXT_FOR_INGREDIENT_TAG_RECIPE,
                         HELP_TEXT_FOR_INGRIDIENTS_AMOUNT)
-from users.models import User
+from recipes.search import search_recipes
+from recipes.storage import ContentAddressedStorage
+from users.models import Subscription, User
+
+# Строк в одной вставке: SQLite ограничивает число параметров запроса.
+UPSERT_BATCH_SIZE = 300
 
 
 class Ingredient(Model):
@@ -80,6 +92,86 @@ class Tag(Model):
         return f'{self.name} {self.color}'
 
 
+class RecipeQuerySet(QuerySet):
+    """Набор запросов для рецептов."""
+
+    def for_read(self, user):
+        """Рецепты со всеми связанными данными для чтения.
+
+        Теги, ингредиенты и автор загружаются отдельными запросами на всю
+        выборку, а признаки избранного, корзины и подписки на автора
+        вычисляются аннотациями, поэтому число запросов не зависит от
+        размера страницы. Вектор полнотекстового поиска API не нужен и
+        не загружается.
+        """
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+            is_favorited = Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+            is_in_shopping_cart = Exists(ShopingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        else:
+            authors = authors.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+            is_favorited = is_in_shopping_cart = Value(
+                False, output_field=BooleanField()
+            )
+        return self.defer('search_vector').prefetch_related(
+            Prefetch('author', queryset=authors),
+            Prefetch('tags'),
+            Prefetch(
+                'ingredient',
+                queryset=AmountIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        ).annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию и описанию."""
+        return search_recipes(self, text)
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты авторов, сгруппированные по id автора.
+
+        Рецепты всех авторов выбираются одним запросом: при поддержке
+        оконных функций лишние строки отсекаются в базе через ROW_NUMBER,
+        иначе (старые версии SQLite) выборка обрезается в Python.
+        """
+        recipes = self.filter(author__in=author_ids).defer('search_vector')
+        if limit is not None and connection.features.supports_over_clause:
+            columns = ', '.join(
+                connection.ops.quote_name(field.column)
+                for field in self.model._meta.concrete_fields
+                if field.name != 'search_vector'
+            )
+            sql, params = recipes.annotate(recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=F('pub_date').desc(),
+            )).query.sql_with_params()
+            recipes = self.raw(
+                f'SELECT {columns} FROM ({sql}) AS latest '
+                'WHERE recipe_rank <= %s ORDER BY pub_date DESC',
+                (*params, limit),
+            )
+        recipes_by_author = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            author_recipes = recipes_by_author[recipe.author_id]
+            if limit is None or len(author_recipes) < limit:
+                author_recipes.append(recipe)
+        return recipes_by_author
+
+
 class Recipe(Model):
     """Модель рецепта для приложения Foodgram."""
 
@@ -107,8 +199,14 @@ class Recipe(Model):
     image = ImageField(
         verbose_name='Картинка',
         upload_to='images/',
+        storage=ContentAddressedStorage(),
         help_text='Обязательное для заполнения поле.',
     )
+    renditions = JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        editable=False,
+    )
     ingredients = ManyToManyField(
         Ingredient,
         verbose_name='Список ингредиентов',
@@ -135,15 +233,83 @@ class Recipe(Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    favorites_count = PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+    trending_score = FloatField(
+        verbose_name='Популярность за последнее время',
+        default=0,
+        editable=False,
+    )
+    # Заполняется триггером PostgreSQL, GIN-индекс создан миграцией 0017:
+    # в состоянии моделей его нет, чтобы SQLite могла пересоздавать таблицу.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            Index(fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'),
+            Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_popular_idx',
+            ),
+            Index(
+                fields=('-trending_score', '-pub_date', '-id'),
+                name='recipe_trending_idx',
+            ),
+            Index(
+                fields=('cooking_time', '-pub_date', '-id'),
+                name='recipe_cooking_time_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}. Автор: {self.author.username}'
 
+    def ingredient_amounts(self):
+        """Количество каждого ингредиента рецепта: {id: количество}."""
+        amounts = {}
+        for ingredient_id, amount in self.ingredient.values_list(
+            'ingredient_id', 'amount'
+        ):
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        return amounts
+
+
+class RecipeSearchIndex(Model):
+    """Индекс FTS5 рецептов в SQLite, его создает
+    recipes.search.create_fts_index. В PostgreSQL таблицы нет."""
+
+    recipe = OneToOneField(
+        Recipe,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_index',
+        on_delete=DO_NOTHING,
+    )
+    match = TextField(db_column='recipes_recipe_fts')
+    rank = FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+
 
 class AmountIngredients(Model):
     """Модель количества ингредиентов для приложения Foodgram."""
@@ -198,6 +364,11 @@ class Favourite(Model):
         related_name='favorites',
         on_delete=CASCADE,
     )
+    created = DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -242,3 +413,222 @@ class ShopingCart(Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в корзину'
+
+
+class ShoppingListTotalQuerySet(QuerySet):
+    """Набор запросов для итогов списков покупок."""
+
+    def apply_amounts(self, user_ids, amounts):
+        """Прибавляет количества ингредиентов к спискам пользователей.
+
+        amounts - словарь {id ингредиента: количество}, отрицательные
+        значения уменьшают итог; строки с нулевым итогом удаляются.
+        Положительные количества прибавляются одной вставкой
+        ON CONFLICT DO UPDATE, поэтому одновременное создание одной и той
+        же строки не нарушает ограничение уникальности.
+        """
+        added = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount > 0
+        }
+        removed = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount < 0
+        }
+        if not user_ids or not (added or removed):
+            return
+        with transaction.atomic(using=self.db):
+            if added:
+                self.upsert_amounts(user_ids, added)
+            if not removed:
+                return
+            totals = list(self.select_for_update().filter(
+                user__in=user_ids, ingredient__in=removed
+            ))
+            for total in totals:
+                total.amount = Greatest(
+                    F('amount') + removed[total.ingredient_id], Value(0)
+                )
+            self.bulk_update(totals, ('amount',))
+            self.filter(
+                user__in=user_ids, ingredient__in=removed, amount__lte=0
+            ).delete()
+
+    def upsert_amounts(self, user_ids, amounts):
+        """Вставляет строки итогов или прибавляет к уже существующим."""
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        rows = [
+            (user_id, ingredient_id, amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+        ]
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                    f'SET amount = {table}.amount + excluded.amount',
+                    [value for row in batch for value in row],
+                )
+
+    def add_recipe(self, user_ids, recipe, sign=1):
+        """Учитывает рецепт в списках покупок пользователей."""
+        self.apply_amounts(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in recipe.ingredient_amounts().items()
+        })
+
+    def remove_recipe(self, user_ids, recipe):
+        """Исключает рецепт из списков покупок пользователей."""
+        self.add_recipe(user_ids, recipe, sign=-1)
+
+    def calculate(self, user_ids=None):
+        """Итоги, посчитанные заново по корзинам: {(user, ingredient): N}.
+
+        user_ids ограничивает расчет корзинами этих пользователей.
+        """
+        carts = {'recipe__shopping_list__isnull': False}
+        if user_ids is not None:
+            carts = {'recipe__shopping_list__user__in': user_ids}
+        return {
+            (row['user_id'], row['ingredient_id']): row['amount']
+            for row in AmountIngredients.objects.filter(**carts).values(
+                'ingredient_id', user_id=F('recipe__shopping_list__user')
+            ).annotate(amount=Sum('amount')).order_by()
+        }
+
+    def rebuild(self, user_id):
+        """Пересчитывает итоги пользователя по его корзине и возвращает
+        число исправленных строк.
+
+        Строка пользователя и его итоги блокируются до расчета, поэтому
+        изменения корзины, выполненные во время пересчета, не теряются.
+        """
+        with transaction.atomic(using=self.db):
+            list(User.objects.select_for_update().filter(
+                pk=user_id
+            ).values_list('pk', flat=True))
+            actual = {
+                total.ingredient_id: total
+                for total in self.select_for_update().filter(user=user_id)
+            }
+            expected = {
+                ingredient_id: amount
+                for (_, ingredient_id), amount in self.calculate(
+                    [user_id]
+                ).items()
+            }
+            stale = [
+                total.pk for ingredient_id, total in actual.items()
+                if ingredient_id not in expected
+            ]
+            changed = []
+            for ingredient_id, amount in expected.items():
+                total = actual.get(ingredient_id)
+                if total is not None and total.amount != amount:
+                    total.amount = amount
+                    changed.append(total)
+            created = [
+                ShoppingListTotal(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for ingredient_id, amount in expected.items()
+                if ingredient_id not in actual
+            ]
+            self.filter(pk__in=stale).delete()
+            self.bulk_update(changed, ('amount',))
+            self.bulk_create(created)
+        return len(stale) + len(changed) + len(created)
+
+
+class ShoppingListTotal(Model):
+    """Итоговое количество ингредиента в списке покупок пользователя.
+
+    Денормализованная сумма AmountIngredients по рецептам из корзины,
+    обновляется при изменении корзины и состава рецептов.
+    """
+
+    user = ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list_totals',
+        on_delete=CASCADE,
+    )
+    ingredient = ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_totals',
+        on_delete=CASCADE,
+    )
+    amount = PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingListTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.amount} {self.ingredient}'
+
+
+class StoredFileQuerySet(QuerySet):
+    """Набор запросов для счетчиков ссылок на файлы."""
+
+    def acquire(self, name):
+        """Увеличивает число ссылок на файл."""
+        if not name or self.filter(name=name).update(
+            references=F('references') + 1
+        ):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, references=1)
+        except IntegrityError:
+            self.filter(name=name).update(references=F('references') + 1)
+
+    def release(self, name):
+        """Уменьшает число ссылок на файл, сам файл удаляет
+        collect_media_garbage."""
+        if name:
+            self.filter(name=name, references__gt=0).update(
+                references=F('references') - 1
+            )
+
+
+class StoredFile(Model):
+    """Число ссылок на файл в хранилище, адресуемом по содержимому.
+
+    Одинаковые картинки разных рецептов хранятся одним файлом, поэтому
+    файл можно удалить, только когда на него не ссылается ни один рецепт.
+    """
+
+    name = CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    references = PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+    objects = StoredFileQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
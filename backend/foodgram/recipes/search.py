@@ -0,0 +1,109 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_TRIGGERS = ('insert', 'delete', 'update')
+WORD = re.compile(r'\w+')
+
+FTS_SQL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    # Название весит больше описания, как setweight 'A' и 'B' в PostgreSQL.
+    f"""
+    INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank)
+    VALUES ('rank', 'bm25(10.0, 1.0)')
+    """,
+)
+
+
+def create_fts_index(connection):
+    """Создает в SQLite индекс FTS5 рецептов и триггеры, которые его
+    обновляют.
+
+    SQLite пересоздает таблицу при изменении ее схемы в миграциях и
+    теряет при этом триггеры, поэтому функция вызывается после каждой
+    миграции и перестраивает индекс, если триггеров не было.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+            'AND name IN (%s, %s, %s)',
+            [f'{FTS_TABLE}_{name}' for name in FTS_TRIGGERS],
+        )
+        if cursor.fetchone()[0] == len(FTS_TRIGGERS):
+            return
+        for statement in FTS_SQL:
+            cursor.execute(statement)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def fts_query(text):
+    """Запрос FTS5: все слова как префиксы, операторы из ввода не
+    действуют."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, с релевантностью search_rank.
+
+    В PostgreSQL ищет по столбцу search_vector с русской морфологией,
+    в SQLite - по индексу FTS5 с поиском по началу слов, в остальных
+    базах - по вхождению подстроки без ранжирования.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+    if vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        # Сравнение со скрытым столбцом-именем таблицы в FTS5 равносильно
+        # MATCH, а столбец rank хранит bm25: чем меньше, тем релевантнее.
+        return queryset.filter(search_index__match=match).annotate(
+            search_rank=-F('search_index__rank')
+        )
+    return queryset.filter(
+        Q(name__icontains=text) | Q(text__icontains=text)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
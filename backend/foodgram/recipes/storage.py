@@ -0,0 +1,36 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+
+    Одинаковые файлы сохраняются один раз: при повторной загрузке
+    возвращается имя уже записанного файла, а запись на диск не
+    выполняется, обновляется только дата изменения. Каталог и
+    расширение берутся из исходного имени.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            return super().save(name, content, max_length)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest.hexdigest() + extension)
+        if self.exists(name):
+            # Свежая дата изменения защищает файл, на который снова
+            # ссылаются, от collect_media_garbage до фиксации рецепта.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 
 from core.texts import EMPTY_STRING
 from users.models import Subscription, User
@@ -13,6 +14,8 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'count_favorites',
+        'recipes_count',
+        'followers_count',
     )
     exclude = [
         'last_login', 'is_staff', 'date_joined',
@@ -22,9 +25,17 @@ class UserAdmin(admin.ModelAdmin):
     list_filter = ('first_name', 'email')
     empty_value_display = EMPTY_STRING
 
-    @admin.display(description='Количество любимых рецептов')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorites_total=Count('favorites')
+        )
+
+    @admin.display(
+        description='Количество любимых рецептов',
+        ordering='favorites_total',
+    )
     def count_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_total
 
 
 @admin.register(Subscription)
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db.models import (CASCADE, CharField, CheckConstraint, EmailField,
-                              F, ForeignKey, Model, Q, UniqueConstraint)
+                              F, ForeignKey, Model, PositiveIntegerField, Q,
+                              UniqueConstraint)
 
 from api.validators import username_validator, validate_clean_text
 from core.limits import Limits
@@ -47,6 +48,18 @@ class User(AbstractUser):
         help_text=HELP_TEXT_FOR_USER,
     )
 
+    recipes_count = PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+
+    followers_count = PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'